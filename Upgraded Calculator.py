@@ -1,187 +1,77 @@
-import ast
-import operator as op
-import json
-import os
-import math
-last_result = None
+import argparse
+import atexit
+import signal
+import sys
+from itertools import chain, islice
+
+# The engine lives in calc_engine/; this file is the interactive menu and
+# the command line on top of it.
+from calc_engine import (
+    DEFAULT_PRECISION, HISTORY_FILE, HISTORY_MEMORY_RECORDS, BATCH_OPS, MODES, BackgroundWriter,
+    Calculator, HistoryBuffer, HistoryIndex, HistoryReader,
+    JournalHistoryManager, compile_expression, factorial_engine, format_record,
+    full_decimal, instrumentation, make_record, parse_assignment, render_number, run_calc,
+    safe_eval,
+)
+from calc_engine import results
 
-HISTORY_FILE = "shakur_history.json"
+last_result = None
 
-_ALLOWED_OPS = {
-    ast.Add: op.add,
-    ast.Sub: op.sub,
-    ast.Mult: op.mul,
-    ast.Div: op.truediv,
-    ast.Mod: op.mod,
-    ast.Pow: op.pow,
-    ast.FloorDiv: op.floordiv,
-    ast.UAdd: op.pos,
-    ast.USub: op.neg,
-}
+HISTORY_PAGE_SIZE = 20
+# Quitting folds the journal into the snapshot once it grows past this
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+
+
+def view_history(reader, unsaved=(), page_size=HISTORY_PAGE_SIZE):
+    # Newest first, one page at a time; older pages are only read on request
+    number = reader.count() + len(unsaved)
+    if number == 0:
+        print("No history yet.")
+        return
+    records = chain(reversed(unsaved), reader.newest())
+    print(f"\nCalculation History ({number} records, newest first):")
+    while number > 0:
+        page = list(islice(records, page_size))
+        if not page:
+            break
+        for rec in page:
+            print(f"{number}. {format_record(rec)}")
+            number -= 1
+        if number > 0 and input("Enter for older records, q to stop: ").strip().lower() == "q":
+            break
 
-def safe_eval(expr: str, last_result=None):
 
-    if expr is None:
-        raise ValueError("No expression provided")
+def _optional_float(prompt):
+    text = input(prompt).strip()
+    return float(text) if text else None
 
-    expr = expr.strip()
-    if expr.lower() == "ans":
-        if last_result is None:
-            raise ValueError("No last result available (ans)")
-        return last_result
 
+def query_history(index, page_size=HISTORY_PAGE_SIZE):
+    op = input("Operation, e.g. divide or / (blank for any): ").strip().lower()
+    op = BATCH_OPS.get(op, op) or None
+    if op is not None and op not in index.by_op:
+        print("No records for that operation.")
+        return
     try:
-            node = ast.parse(expr, mode="eval")
-    except SyntaxError as e:
-            raise ValueError(f"Syntax error: {e}")
-    return _eval(node, last_result=last_result)
-def _eval(node, last_result=None):
-
-    if isinstance(node, ast.Expression):
-        return _eval(node.body)
-
-    if isinstance(node, ast.BinOp):
-                left = _eval(node.left)
-                right = _eval(node.right)
-                op_type = type(node.op)
-                if op_type in _ALLOWED_OPS:
-                    return _ALLOWED_OPS[op_type](left, right)
-                raise ValueError(f"Operator {op_type} not allowed")
-    
-    if isinstance(node, ast.UnaryOp):
-            operand = _eval(node.operand)
-            op_type = type(node.op)
-            if op_type in _ALLOWED_OPS:
-                return _ALLOWED_OPS[op_type](operand)
-            raise ValueError(f"Unary operator {op_type} not allowed")
-
-    if isinstance(node, ast.Constant):
-        if isinstance(node.value, (int, float)):
-            return node.value
-        raise ValueError("Only numeric constants are allowed")
-
-
-    if isinstance(node, ast.Name):
-            if node.id == "ans":
-                if last_result is None:
-                    raise ValueError("No last result available (ans)")
-                return last_result
-            raise ValueError(f"Use of name '{node.id}' is not allowed")
-    
-    raise ValueError(f"Unsupported expression element: {type(node)}")
-
-class Calculator:
-    def __init__(self):
-        self.last_result = None
-
-    def _store_and_format(self, result, message, update_last=True):
-        if update_last and result is not None:
-            self.last_result = result
-        return result, message
-
-    def add(self, a, b):
-        return self._store_and_format(a + b, f"{a} + {b} = {a + b}")
-
-    def subtract(self, a, b):
-        return self._store_and_format(a - b, f"{a} - {b} = {a - b}")
-    
-    def multiply(self, a, b):
-        return self._store_and_format(a * b, f"{a} * {b} = {a * b}")
-    
-    def divide(self, a, b):
-        if b == 0:
-            return None, "Cannot divide by zero."
-        res = round(a / b, 2)
-        return self._store_and_format(res, f"{a} / {b} = {res}")
-    
-    def modulus(self, a, b):
-        if b == 0:
-            return None, "Cannot perform modulus with zero."
-        return self._store_and_format(a % b, f"{a} % {b} = {a % b}")
-
-    def exponent(self, a, b):
-        try:
-            result = a ** b
-            
-            if abs(result) > 10**100:
-                return None, f"{a} ** {b} = too large"
-            return self._store_and_format(result, f"{a} ** {b} = {result}")
-        except OverflowError:
-            return None, f"{a} ** {b} = overflow error"
-        except ValueError as e:
-            return None, f"{a} ** {b} = error: {e}"    
-
-    def check_even_odd(self, a, b):
-        try:
-            ea = "Even" if int(a) % 2 == 0 else "Odd"
-            eb = "Even" if int(b) % 2 == 0 else "Odd"
-            return None, f"{a} is {ea}, {b} is {eb}"
-        except Exception as e:
-            return None, f"Error checking even/odd: {e}"
-        
-    def percentage_of(self, a, b):
-        try:
-            result = (a / 100.0) * b
-            return self._store_and_format(result, f"{a}% of {b} = {result}")
-        except Exception as e:
-            return None, f"Error computing percentage: {e}"
-        
-    def factorial(self, a):
-        try:
-            n = int(a)
-            if n < 0:
-                return None, "Factorial not defined for negative numbers"
-            if n > 5000:
-                return None, f"Factorial too large: {n}! (max: 5000)"
-            result = math.factorial(n)
-            return self._store_and_format(result, f"{n}! = {result}")
-        except Exception as e:
-            return None, f"Error computing factorial: {e}"    
-
-    def base_convert(self, a, base):
-        try:
-            n = int(a)
-            if base == 2:
-                out = bin(n)
-            elif base == 8:
-                out = oct(n)
-            elif base == 16:
-                out = hex(n)
-            else:
-                return None, "Unsupported base"
-            # keep numeric last_result unchanged for base conversions
-            return None, f"{n} in base {base} = {out}"
-        except Exception as e:
-            return None, f"Error converting base: {e}"
-
-class HistoryManager:
-    def __init__(self, filename="shakur_history.json"):
-        self.filename = filename
-    
-    def load_history(self):
-        if os.path.exists(self.filename):
-            try:
-                with open(self.filename, "r") as f:
-                    return json.load(f)
-            except Exception:
-                return []
-        return []
-    
-    def save_history(self, history):
-        try:
-            with open(self.filename, "w") as f:
-                json.dump(history, f, indent=4)
-        except Exception as e:
-            print(f"Warning: failed to save history: {e}")
-
-    def clear_history(self):
-            try:
-                with open(self.filename, "w") as f:
-                    json.dump([], f)
-            except Exception as e:
-                print(f"Warning: failed to clear history: {e}")
-
-def get_expression_input(prompt, last_result):
+        low = _optional_float("Minimum result (blank for none): ")
+        high = _optional_float("Maximum result (blank for none): ")
+    except ValueError:
+        print("Invalid number.")
+        return
+    stats = index.aggregate(op, low, high)
+    matches = index.query(op, low, high, limit=page_size)
+    if stats["count"]:
+        print(f"{stats['count']} numeric results: sum {stats['sum']}, min {stats['min']}, "
+              f"max {stats['max']}, mean {stats['mean']}")
+    if not matches:
+        print("No matching records.")
+        return
+    print(f"Most recent {len(matches)} matches:")
+    for rec in matches:
+        print(format_record(rec))
+
+
+def get_expression_input(prompt, last_result, pool=None, variables=None, mode=None):
      while True:
         s = input(prompt).strip()
         if s.lower() == "q":
@@ -190,11 +80,13 @@ def get_expression_input(prompt, last_result):
             if last_result is None:
                 print("No previous result available.")
                 continue
-            print(f"Using last result: {last_result}")
+            print(f"Using last result: {render_number(last_result)}")
             return last_result
         
         try:
-            val = safe_eval(s, last_result=last_result)
+            if pool is not None and not compile_expression(s, mode).free_names:
+                return pool.call(("eval", s, last_result))[0]
+            val = safe_eval(s, last_result=last_result, variables=variables.values if variables is not None else None, mode=mode)
             return val    
         except Exception as e:
             print(f"Invalid expression: {e}. Enter a number, expression, 'ans', or 'q'.")
@@ -216,41 +108,80 @@ def show_menu(autosave_enabled):
     print("13. Factorial (n!)")
     print("14. Number base converter")
     print(f"15. Toggle autosave (currently {'ON' if autosave_enabled else 'OFF'})")
+    print("16. Compact history file")
+    print("17. Show full last result")
+    print("18. Performance stats")
+    print("19. Set variable (name = expression)")
+    print("20. Show variables")
+    print("21. Query history")
+    print("22. Read number from another base")
     print("------------------")
 
 
+def _exit_on_signal(signum, frame):
+    # turn SIGTERM/SIGHUP into a normal exit so atexit handlers still run
+    raise SystemExit(128 + signum)
+
 
-def main():
-    calc = Calculator()
-    history = HistoryManager().load_history()
-    history_manager = HistoryManager()
+def main(pool=None, autosave_interval=1.0, autosave_batch=50, history_memory=HISTORY_MEMORY_RECORDS,
+         mode=None, precision=DEFAULT_PRECISION):
+    calc = Calculator(mode=mode, precision=precision)
+    history_manager = JournalHistoryManager(HISTORY_FILE, flush_every=10**9)
+    history_writer = BackgroundWriter(history_manager, autosave_interval, autosave_batch)
+    atexit.register(history_writer.close)
+    for name in ("SIGTERM", "SIGHUP"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), _exit_on_signal)
+    history_reader = HistoryReader(HISTORY_FILE)
+    unsaved = HistoryBuffer(capacity=history_memory)  # records made while autosave is off
+    index = None  # built on the first query, then kept up to date
     autosave = True  # default ON as you wanted
 
+    def record(op, operands, result, message):
+        rec = make_record(op, operands, result, message)
+        if index is not None:
+            index.add(rec)
+        if autosave:
+            history_writer.submit(rec)
+        else:
+            unsaved.append(rec)
+
+    def save_unsaved():
+        for rec in unsaved:
+            history_writer.submit(rec)
+        unsaved.clear()
+
     print("Welcome to Shakur's Upgraded Calculator!")
+    if calc.numbers.exact:
+        print(f"Numeric mode: {calc.numbers.name}"
+              + (f" ({calc.numbers.precision} digits)" if calc.numbers.name == "decimal" else ""))
 
     while True:
         show_menu(autosave)
-        choice = input("Enter your choice (1-15): ").strip()
+        choice = input("Enter your choice (1-22): ").strip()
 
         if choice == "8":  # Quit
-            history_manager.save_history(history)
+            save_unsaved()
+            history_writer.close()
+            if history_manager.journal_size() > JOURNAL_COMPACT_BYTES:
+                history_manager.compact()
+            history_manager.close()
             print("History saved. Goodbye!")
             break
 
         if choice == "9":  # View history
-            if not history:
-                print("No history yet.")
-            else:
-                print("\nCalculation History:")
-                for i, rec in enumerate(history, 1):
-                    print(f"{i}. {rec}")
+            history_writer.sync()
+            view_history(history_reader, unsaved)
             continue
 
         if choice == "10":  # Clear history
             c = input("Clear history? (y/n): ").strip().lower()
             if c == "y":
-                history = []
-                history_manager.clear_history()
+                unsaved.clear()
+                history_writer.sync()
+                with history_writer.lock:
+                    history_manager.clear_history()
+                index = None
                 print("History cleared.")
             else:
                 print("Cancelled.")
@@ -258,93 +189,244 @@ def main():
 
         if choice == "15":  # Toggle autosave
             autosave = not autosave
-            print(f"Autosave {'enabled' if autosave else 'disabled'}.")
+            if autosave:
+                save_unsaved()
+            if not autosave:
+                print("Autosave disabled.")
+            elif autosave_interval > 0:
+                print(f"Autosave enabled (written every {autosave_interval:g}s or {autosave_batch} records).")
+            else:
+                print("Autosave enabled (every record written as it happens).")
+            continue
+
+        if choice == "16":  # Compact history
+            save_unsaved()
+            history_writer.sync()
+            with history_writer.lock:
+                count = history_manager.compact()
+            print(f"History compacted ({count} records).")
+            continue
+
+        if choice == "17":  # Full decimal form of the last result
+            if calc.last_result is None:
+                print("No previous result available.")
+            else:
+                print(full_decimal(calc.last_result))
             continue
 
-        if choice not in [str(i) for i in range(1, 16)]:
+        if choice == "18":  # Instrumentation
+            print(history_writer.report())
+            if results.result_cache is not None:
+                print("\n".join(results.result_cache.report()))
+            if not instrumentation.enabled:
+                c = input("Instrumentation is off. Turn it on? (y/n): ").strip().lower()
+                if c == "y":
+                    instrumentation.enable()
+                    print("Instrumentation on; stats will show from now.")
+            else:
+                instrumentation.print_stats()
+            continue
+
+        if choice == "19":  # Assign a variable
+            text = input("Enter assignment, e.g. rate = 0.07 (or 'q'): ").strip()
+            if text.lower() == "q":
+                continue
+            assignment = parse_assignment(text)
+            if assignment is None:
+                print("Invalid assignment. Use: name = expression")
+                continue
+            try:
+                updated = calc.variables.assign(*assignment, ans=calc.last_result)
+            except ValueError as e:
+                print(f"Invalid assignment: {e}")
+                continue
+            print("Result:", calc.variables.describe(assignment[0]))
+            if len(updated) > 1:
+                print(f"Recomputed {len(updated) - 1} dependent variable(s).")
+            continue
+
+        if choice == "20":  # List variables
+            if not calc.variables.cells:
+                print("No variables defined.")
+            for name in calc.variables.cells:
+                print(calc.variables.describe(name))
+            continue
+
+        if choice == "21":  # Query history
+            if index is None:
+                history_writer.sync()
+                index = HistoryIndex(chain(history_reader.oldest(), unsaved))
+            query_history(index)
+            continue
+
+        if choice not in [str(i) for i in range(1, 23)]:
             print("Invalid choice.")
             continue
 
         # Single-input expression option
         if choice == "11":
-            val = get_expression_input("Enter expression (or 'ans'/'q'): ", calc.last_result)
+            val = get_expression_input("Enter expression (or 'ans'/'q'): ", calc.last_result, pool, calc.variables, calc.numbers)
             if val == "back_to_menu":
                 continue
-            message = f"Expression = {val}"
+            message = f"Expression = {render_number(val)}"
             print("Result:", message)
-            history.append(message)
-            calc.last_result = val 
-            if autosave:
-                history_manager.save_history(history)
+            record("expression", [], val, message)
+            calc.last_result = val
             continue
 
         # Factorial (single operand)
         if choice == "13":
-            n = get_expression_input("Enter integer n (or 'ans'/'q'): ", calc.last_result)
+            n = get_expression_input("Enter integer n (or 'ans'/'q'): ", calc.last_result, pool, calc.variables, calc.numbers)
             if n == "back_to_menu":
                 continue
-            result, message = calc.factorial(n)
+            result, message = run_calc(calc, pool, "factorial", n)
             print("Result:", message)
-            history.append(message)
-            if autosave:
-                history_manager.save_history(history)
+            record("factorial", [n], result, message)
             continue
 
         # Percentage (a% of b)
         if choice == "12":
-            a = get_expression_input("Enter percentage a (or 'ans'/'q'): ", calc.last_result)
+            a = get_expression_input("Enter percentage a (or 'ans'/'q'): ", calc.last_result, pool, calc.variables, calc.numbers)
             if a == "back_to_menu":
                 continue
-            b = get_expression_input("Enter value b (or 'ans'/'q'): ", calc.last_result)
+            b = get_expression_input("Enter value b (or 'ans'/'q'): ", calc.last_result, pool, calc.variables, calc.numbers)
             if b == "back_to_menu":
                 continue
-            result, message = calc.percentage_of(a, b)
+            result, message = run_calc(calc, pool, "percentage_of", a, b)
             print("Result:", message)
-            history.append(message)
-            if autosave:
-                history_manager.save_history(history)
+            record("percentage_of", [a, b], result, message)
             continue
 
         # Base converter
         if choice == "14":
-            n = get_expression_input("Enter integer (or 'ans'/'q'): ", calc.last_result)
+            n = get_expression_input("Enter integer (or 'ans'/'q'): ", calc.last_result, pool, calc.variables, calc.numbers)
             if n == "back_to_menu":
                 continue
-            base_choice = input("Target base (2=binary, 8=octal, 16=hex): ").strip()
+            base_choice = input("Target base (2-36, or 64 for base64): ").strip()
             try:
                 base = int(base_choice)
             except ValueError:
                 print("Invalid base selection.")
                 continue
-            result, message = calc.base_convert(n, base)
+            result, message = run_calc(calc, pool, "base_convert", n, base)
             print("Result:", message)
-            history.append(message)
-            if autosave:
-                history_manager.save_history(history)
+            record("base_convert", [n, base], result, message)
             continue
 
-        a = get_expression_input("Enter first operand (or 'ans'/'q'): ", calc.last_result)
+        # Read a number written in another base
+        if choice == "22":
+            text = input("Digits to read (or 'q'): ").strip()
+            if text.lower() == "q":
+                continue
+            try:
+                base = int(input("Written in base (2-36, or 64 for base64): ").strip())
+            except ValueError:
+                print("Invalid base selection.")
+                continue
+            result, message = run_calc(calc, pool, "parse_base", text, base)
+            print("Result:", message)
+            record("parse_base", [base], result, message)
+            continue
+
+        a = get_expression_input("Enter first operand (or 'ans'/'q'): ", calc.last_result, pool, calc.variables, calc.numbers)
         if a == "back_to_menu":
             continue
-        b = get_expression_input("Enter second operand (or 'ans'/'q'): ", calc.last_result)
+        b = get_expression_input("Enter second operand (or 'ans'/'q'): ", calc.last_result, pool, calc.variables, calc.numbers)
         if b == "back_to_menu":
             continue    
     
         ops = {
-            "1": calc.add,
-            "2": calc.subtract,
-            "3": calc.multiply,
-            "4": calc.divide,
-            "5": calc.modulus,
-            "6": calc.exponent,
-            "7": calc.check_even_odd,
+            "1": "add",
+            "2": "subtract",
+            "3": "multiply",
+            "4": "divide",
+            "5": "modulus",
+            "6": "exponent",
+            "7": "check_even_odd",
         }
-        func = ops.get(choice)
-        result, message = func(a, b)
+        result, message = run_calc(calc, pool, ops[choice], a, b)
         print("Result:", message)
-        history.append(message)
-        if autosave:
-            history_manager.save_history(history)
+        record(ops[choice], [a, b], result, message)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Shakur's Upgraded Calculator")
+    parser.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                        help="evaluate one expression or 'op a b' per line ('-' for stdin)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run operations in this many worker processes")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="seconds before a worker job is killed")
+    parser.add_argument("--max-factorial", type=int, default=5000,
+                        help="largest n accepted by the factorial operation")
+    parser.add_argument("--factorial-cache", metavar="FILE",
+                        help="keep factorial checkpoints in FILE between sessions")
+    parser.add_argument("--result-cache", metavar="FILE",
+                        help="keep results of expensive evaluations in FILE (SQLite) between sessions")
+    parser.add_argument("--result-cache-mb", type=float, default=64,
+                        help="size bound of the result cache in MiB (default 64)")
+    parser.add_argument("--autosave-interval", type=float, default=1.0, metavar="SECONDS",
+                        help="write autosaved history at most this long after a calculation; 0 writes every one")
+    parser.add_argument("--autosave-batch", type=int, default=50, metavar="N",
+                        help="write autosaved history once N records are waiting (default 50)")
+    parser.add_argument("--history-memory", type=int, default=HISTORY_MEMORY_RECORDS, metavar="N",
+                        help="unsaved history records kept in memory before older ones spill to a "
+                             f"temp file (default {HISTORY_MEMORY_RECORDS})")
+    parser.add_argument("--mode", choices=MODES, default="float",
+                        help="numbers as floats (default), exact decimals or exact fractions")
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION, metavar="DIGITS",
+                        help=f"significant digits in decimal mode (default {DEFAULT_PRECISION})")
+    parser.add_argument("--serve", nargs="?", const="127.0.0.1:8765", metavar="HOST:PORT",
+                        help="serve JSON-line requests over TCP (default 127.0.0.1:8765)")
+    parser.add_argument("--unix", metavar="PATH", help="serve on a Unix socket instead of TCP")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="record operation timings; written on exit as JSON (or Prometheus for .prom/.txt)")
+    parser.add_argument("--profile-op", metavar="NAME",
+                        help="run cProfile around the next call of one operation, e.g. Calculator.factorial")
+    args = parser.parse_args(argv)
+    if args.mode != "float" and (args.serve is not None or args.unix is not None):
+        parser.error("the service only calculates in float mode")
+    return args
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    factorial_engine.max_n = args.max_factorial
+    if args.factorial_cache:
+        factorial_engine.path = args.factorial_cache
+        factorial_engine.load(args.factorial_cache)
+    if args.result_cache:
+        results.set_result_cache(results.ResultCache(args.result_cache, int(args.result_cache_mb * 1024 * 1024)))
+    if args.stats or args.profile_op:
+        instrumentation.enable()
+    if args.stats:
+        atexit.register(instrumentation.dump, args.stats)
+    if args.profile_op:
+        from calc_engine import cprofile_hook
+        instrumentation.profile_next(args.profile_op, cprofile_hook())
+    serving = args.serve is not None or args.unix is not None
+    pool = None
+    if args.workers > 0 or serving:
+        from calc_engine import JobPool
+        pool = JobPool(args.workers, args.timeout, args.mode, args.precision)
+    try:
+        if serving:
+            import asyncio
+            from calc_engine import serve
+            host, _, port = (args.serve or "127.0.0.1:8765").rpartition(":")
+            try:
+                asyncio.run(serve(host or "127.0.0.1", int(port), args.unix, pool))
+            except KeyboardInterrupt:
+                print("Server stopped.")
+        elif args.batch is not None:
+            from calc_engine import batch_main
+            batch_main(args.batch, pool, Calculator(mode=args.mode, precision=args.precision))
+        else:
+            main(pool, args.autosave_interval, args.autosave_batch, args.history_memory,
+                 args.mode, args.precision)
+    finally:
+        if pool is not None:
+            pool.close()
+        if factorial_engine.path:
+            factorial_engine.save()
+        if results.result_cache is not None:
+            print("\n".join(results.result_cache.report()), file=sys.stderr)
@@ -0,0 +1,440 @@
+import argparse
+import ast
+import contextlib
+import importlib.util
+import itertools
+import json
+import operator
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import calc_engine as uc
+
+# Benchmarks for the calculator hot paths.
+#   python3 benchmark.py --out bench.json
+#   python3 benchmark.py --compare bench.json      (flags regressions)
+#   python3 benchmark.py --import-budget 50        (fails if the engine imports slower)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Fresh-interpreter imports, timed against a bare `python -c pass`
+IMPORT_CASES = {
+    "import/calc_engine": "import calc_engine",
+    "import/calculator": "import calc_engine; calc_engine.Calculator; calc_engine.safe_eval",
+    "import/history": "import calc_engine; calc_engine.JournalHistoryManager",
+    "import/fraction_mode": "import calc_engine; calc_engine.Calculator(mode='fraction')",
+}
+
+
+def load_script(name, filename):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(func, min_time=0.2, repeat=3):
+    # Best seconds-per-call over `repeat` rounds of at least `min_time` each
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10 or number >= 1 << 20:
+            break
+        number *= 10
+    number = max(1, int(number * (min_time / 10) / max(elapsed, 1e-9)))
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        per_call = (time.perf_counter() - start) / number
+        best = per_call if best is None else min(best, per_call)
+    return best
+
+
+def time_import(statement, repeat=10):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=HERE, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def import_times(args):
+    baseline = time_import("pass")
+    times = {}
+    for name, statement in IMPORT_CASES.items():
+        if args.filter and args.filter not in name:
+            continue
+        times[name] = max(0.0, time_import(statement) - baseline)
+        print(f"{name:45s} {times[name] * 1e6:14.3f} us")
+    return times
+
+
+# safe_eval before the compiler: an ast tree walk, kept as the yardstick for
+# first-time evaluation
+_WALKER_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.FloorDiv: operator.floordiv, ast.UAdd: operator.pos, ast.USub: operator.neg,
+}
+
+
+def walker_eval(expr, ans):
+    def walk(node):
+        if isinstance(node, ast.BinOp):
+            return _WALKER_OPS[type(node.op)](walk(node.left), walk(node.right))
+        if isinstance(node, ast.UnaryOp):
+            return _WALKER_OPS[type(node.op)](walk(node.operand))
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name) and node.id == "ans":
+            return ans
+        raise ValueError(f"Unsupported expression element: {type(node)}")
+    return walk(ast.parse(expr.strip(), mode="eval").body)
+
+
+def eval_cases(uc):
+    long_expr = "+".join(str(i % 97) + "*ans" for i in range(10000))
+    cases = {
+        "safe_eval/short_cached": lambda: uc.safe_eval("(ans * 1.07 - 3) / 2", 5),
+        "safe_eval/long_cached": lambda: uc.safe_eval(long_expr, 5),
+        "safe_eval/calls_cached": lambda: uc.safe_eval("sqrt(ans) + log(ans, 2) * sin(ans)", 5),
+        "safe_eval/const_call_memo": lambda: uc.safe_eval("factorial(3000) % 1000007"),
+    }
+
+    def cold_short():
+        uc.clear_compile_cache()
+        uc.safe_eval("(ans * 1.07 - 3) / 2", 5)
+
+    def cold_long():
+        uc.clear_compile_cache()
+        uc.safe_eval(long_expr, 5)
+
+    cases["safe_eval/short_cold"] = cold_short
+    cases["safe_eval/long_cold"] = cold_long
+
+    # first-time evaluation of long generated expressions, each one new to
+    # the compile cache, against the tree walker on the same texts
+    rng = random.Random(1)
+    generated = ["+".join(f"{rng.randrange(1000)}*ans" if i % 2 else f"{rng.random():.4f}" for i in range(900))
+                 for _ in range(64)]
+    turn = itertools.count()
+
+    def first_long():
+        uc.clear_compile_cache()
+        uc.safe_eval(generated[next(turn) % 64], 5)
+
+    cases["safe_eval/first_long"] = first_long
+    cases["walker/first_long"] = lambda: walker_eval(generated[next(turn) % 64], 5)
+
+    # one instruction of each kind, run on the VM directly
+    for label, expr in [("add", "ans + x"), ("sub", "ans - x"), ("mul", "ans * x"),
+                        ("div", "ans / x"), ("floordiv", "ans // x"), ("mod", "ans % x"),
+                        ("pow", "ans ** x"), ("neg", "-ans"), ("const", "7"),
+                        ("name", "ans"), ("shared", "(ans + x) * (ans + x)"),
+                        ("call1", "sqrt(ans)"), ("call2", "atan2(ans, x)"), ("call3", "gcd(ans, x, 12)")]:
+        code = uc.compile_expression(expr).optimize().code
+        env = {"x": 3}
+        cases[f"vm/{label}"] = lambda code=code, env=env: uc.execute(code, 7, env)
+    return cases
+
+
+def calculator_cases(uc):
+    calc = uc.Calculator()
+    operands = {
+        "small": (7196, 4),
+        "float": (7196.5, 4.25),
+        "huge": (3**20000 + 1, 3**19990 + 7),
+    }
+    cases = {}
+    for size, (a, b) in operands.items():
+        for name in ("add", "subtract", "multiply", "divide", "modulus", "check_even_odd", "percentage_of"):
+            method = getattr(calc, name)
+            cases[f"calculator/{name}/{size}"] = lambda method=method, a=a, b=b: method(a, b)
+        cases[f"calculator/base_convert/{size}"] = lambda a=a: calc.base_convert(int(a), 16)
+    cases["calculator/exponent/small"] = lambda: calc.exponent(7, 30)
+    cases["calculator/exponent/float"] = lambda: calc.exponent(7.5, 20.5)
+    cases["calculator/exponent/refused"] = lambda: calc.exponent(9, 9**9)
+    cases["calculator/factorial/small"] = lambda: calc.factorial(20)
+    cases["calculator/factorial/cached_5000"] = lambda: calc.factorial(5000)
+    cases["calculator/factorial/cold_5000"] = lambda: uc.Calculator(uc.FactorialEngine()).factorial(5000)
+    return cases
+
+
+def mode_cases(uc):
+    # The same work in each numeric mode; mode_overhead() reports the ratios
+    # against float.  Whole-number inputs take the exact modes' native path.
+    cases = {}
+    for mode, precision in [("float", None), ("decimal", 28), ("decimal", 100), ("fraction", None)]:
+        calc = uc.Calculator(mode=mode, precision=precision or uc.DEFAULT_PRECISION)
+        label = f"mode/{mode}{precision or ''}" if mode == "decimal" else f"mode/{mode}"
+        numbers = calc.numbers
+        a, b = calc.number("7196.25"), calc.number("4.75")
+        env = {"x": calc.number("1.07")}
+        cases[f"{label}/parse"] = lambda calc=calc: calc.number("19.99")
+        cases[f"{label}/calc_add_int"] = lambda calc=calc: calc.add(7196, 4)
+        cases[f"{label}/calc_add"] = lambda calc=calc, a=a, b=b: calc.add(a, b)
+        cases[f"{label}/calc_divide"] = lambda calc=calc, a=a, b=b: calc.divide(a, b)
+        cases[f"{label}/calc_percentage"] = lambda calc=calc, a=a, b=b: calc.percentage_of(b, a)
+        cases[f"{label}/eval_int"] = lambda m=numbers: uc.safe_eval("(ans * 12 - 3) // 2 + 7 ** 3", 5, mode=m)
+        cases[f"{label}/eval_mixed"] = lambda m=numbers, env=env: uc.safe_eval("(ans * x - 3) / 2", 5, env, m)
+        cases[f"{label}/eval_calls"] = lambda m=numbers: uc.safe_eval("sqrt(ans) + log(ans, 2)", 5, mode=m)
+
+        def cold(m=numbers):
+            uc.clear_compile_cache()
+            uc.safe_eval("(ans * 1.07 - 3) / 2", 5, mode=m)
+
+        cases[f"{label}/eval_cold"] = cold
+    return cases
+
+
+def mode_overhead(results):
+    # mode/<mode>/<case> times as multiples of mode/float/<case>
+    lines = []
+    for name, seconds in results.items():
+        parts = name.split("/")
+        if parts[0] != "mode" or parts[1] == "float":
+            continue
+        base = results.get(f"mode/float/{parts[2]}")
+        if base:
+            lines.append(f"{name:45s} {seconds / base:8.2f}x float")
+    if lines:
+        print("\nNumeric mode overhead:")
+        print("\n".join(lines))
+
+
+def history_cases(uc, max_records, tmpdir, wanted, cleanup):
+    # fixtures are only written for the sizes and cases --filter keeps
+    cases = {}
+    size = 100
+    while size <= max_records:
+        if not any(wanted(f"history/{case}/{size}") for case in ("save", "load", "tail20", "query")):
+            size *= 10
+            continue
+        records = [f"{i} + {i} = {2 * i}" for i in range(size)]
+        path = os.path.join(tmpdir, f"history-{size}.json")
+        manager = uc.HistoryManager(path)
+        manager.save_history(records)
+        cases[f"history/save/{size}"] = lambda m=manager, r=records: m.save_history(r)
+        cases[f"history/load/{size}"] = lambda m=manager: m.load_history()
+        reader = uc.HistoryReader(path)
+        cases[f"history/tail20/{size}"] = lambda r=reader: r.tail(20)
+        index = uc.HistoryIndex(records)
+        cases[f"history/query/{size}"] = lambda i=index, s=size: i.aggregate("add", s // 2, s)
+        size *= 10
+
+    if wanted("history/journal_append"):
+        journal = uc.JournalHistoryManager(os.path.join(tmpdir, "journal.json"), fsync=False)
+        cases["history/journal_append"] = lambda: journal.append("7196 - 4 = 7192")
+    if wanted("history/autosave_submit"):
+        writer = uc.BackgroundWriter(uc.JournalHistoryManager(os.path.join(tmpdir, "autosave.json"),
+                                                              flush_every=10**9, fsync=False))
+        cleanup.callback(writer.close)
+        cases["history/autosave_submit"] = lambda: writer.submit("7196 - 4 = 7192")
+    return cases
+
+
+CACHE_CASES = ("result_cache/hit_small", "result_cache/hit_big", "result_cache/miss", "result_cache/encode_big")
+
+
+def cache_cases(uc, tmpdir, wanted):
+    if not any(map(wanted, CACHE_CASES)):
+        return {}
+    cache = uc.ResultCache(os.path.join(tmpdir, "results.db"))
+    big = 7**300000
+    cache.put("bench:big", big, None, seconds=1.0)
+    cache.put("bench:small", 12345, None, seconds=1.0)
+    return dict(zip(CACHE_CASES, [
+        lambda: cache.get("bench:small"),
+        lambda: cache.get("bench:big"),
+        lambda: cache.get("bench:missing"),
+        lambda: uc.encode_result(big),
+    ]))
+
+
+BASE_CASES = ("to10", "builtin_str", "to36", "to16", "from10", "builtin_int", "from36")
+
+
+def base_cases(max_digits, wanted):
+    # calc_engine.bases against the builtin str()/int() path, 10**3 digits up
+    from calc_engine import bases
+    if hasattr(sys, "set_int_max_str_digits"):
+        sys.set_int_max_str_digits(0)
+    cases = {}
+    digits = 1000
+    while digits <= max_digits:
+        if not any(wanted(f"bases/{case}/{digits}") for case in BASE_CASES):
+            digits *= 10
+            continue
+        n = 7 ** int(digits / 0.845)  # ~`digits` decimal digits
+        text = bases.to_base(n, 10)
+        text36 = bases.to_base(n, 36)
+        cases[f"bases/to10/{digits}"] = lambda n=n: bases.to_base(n, 10)
+        cases[f"bases/builtin_str/{digits}"] = lambda n=n: str(n)
+        cases[f"bases/to36/{digits}"] = lambda n=n: bases.to_base(n, 36)
+        cases[f"bases/to16/{digits}"] = lambda n=n: bases.to_base(n, 16)
+        cases[f"bases/from10/{digits}"] = lambda s=text: bases.from_base(s, 10)
+        cases[f"bases/builtin_int/{digits}"] = lambda s=text: int(s)
+        cases[f"bases/from36/{digits}"] = lambda s=text36: bases.from_base(s, 36)
+        digits *= 10
+    small = list(range(-500, 500))
+    cases["bases/many_small"] = lambda: bases.to_base_many(small, 36)
+    cases["bases/one_by_one_small"] = lambda: [bases.to_base(n, 36) for n in small]
+    return cases
+
+
+def history_memory(uc, count=20000):
+    # Bytes per record held in memory, as a list vs a HistoryBuffer.  The
+    # message column repeats a handful of lines, like a typical session.
+    def records():
+        for i in range(count):
+            yield uc.make_record("add", [i, 4], i + 4, f"{i} + 4 = {i + 4}")
+
+    def messages():
+        for i in range(count):
+            yield f"Expression = {i % 50}"
+
+    def per_record(build, source):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        held = build(source())
+        size = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del held
+        return size / count
+
+    sizes = {
+        "memory/history_list/records": per_record(list, records),
+        "memory/history_buffer/records": per_record(lambda r: uc.HistoryBuffer(r, capacity=count), records),
+        "memory/history_list/messages": per_record(list, messages),
+        "memory/history_buffer/messages": per_record(lambda r: uc.HistoryBuffer(r, capacity=count), messages),
+        "memory/history_buffer/spilled": per_record(lambda r: uc.HistoryBuffer(r, capacity=1000), records),
+    }
+    for name, size in sizes.items():
+        print(f"{name:45s} {size:14.1f} B/record")
+    return sizes
+
+
+SHAKUR_CASES = [("1", "add"), ("2", "subtract"), ("3", "multiply"), ("4", "divide"),
+                ("5", "modulus"), ("6", "exponent"), ("7", "even_odd")]
+
+
+def shakur_cases(wanted):
+    if not any(wanted(f"perform_operation/{label}") for _, label in SHAKUR_CASES):
+        return {}
+    shakur = load_script("shakur_machine", "shakur,s_machine.py")
+    cases = {}
+    for choice, label in SHAKUR_CASES:
+        cases[f"perform_operation/{label}"] = lambda c=choice: shakur.perform_operation(c, 7196.0, 4.0)
+    return cases
+
+
+def run(args):
+    def wanted(name):
+        return not args.filter or args.filter in name
+
+    # Fixtures (history files, the cache database, big numbers) are only
+    # built for cases --filter keeps; files go in a temporary directory that
+    # is removed, after the background writer stops, when the run ends
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="calc-bench-") as tmpdir, contextlib.ExitStack() as cleanup:
+        cases = {}
+        cases.update(eval_cases(uc))
+        cases.update(calculator_cases(uc))
+        cases.update(history_cases(uc, args.max_records, tmpdir, wanted, cleanup))
+        cases.update(cache_cases(uc, tmpdir, wanted))
+        cases.update(base_cases(args.max_digits, wanted))
+        cases.update(mode_cases(uc))
+        cases.update(shakur_cases(wanted))
+        for name, func in cases.items():
+            if not wanted(name):
+                continue
+            try:
+                seconds = measure(func, args.min_time)
+            except Exception as e:
+                print(f"{name:45s} failed: {type(e).__name__}: {e}")
+                continue
+            results[name] = seconds
+            print(f"{name:45s} {seconds * 1e6:14.3f} us")
+    mode_overhead(results)
+    first, walker = results.get("safe_eval/first_long"), results.get("walker/first_long")
+    if first and walker:
+        print(f"\nFirst-time long expression: {walker / first:.2f}x the tree walker's speed")
+    results.update(import_times(args))
+    if not args.filter or "memory" in args.filter:
+        results.update(history_memory(uc))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    regressions = 0
+    print(f"\n{'benchmark':45s} {'baseline':>12s} {'current':>12s} {'ratio':>8s}")
+    for name, seconds in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = seconds / old
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:45s} {old * 1e6:12.3f} {seconds * 1e6:12.3f} {ratio:8.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the calculator hot paths")
+    parser.add_argument("--out", metavar="FILE", help="write results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown reported as a regression (default 0.10)")
+    parser.add_argument("--max-records", type=int, default=10**5,
+                        help="largest history size to benchmark (use 1000000 for the full run)")
+    parser.add_argument("--max-digits", type=int, default=10**5,
+                        help="largest base conversion to benchmark (use 1000000 for the full run)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing round")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--import-budget", type=float, default=50.0, metavar="MS",
+                        help="fail if any import/ case takes longer (default 50 ms)")
+    args = parser.parse_args()
+
+    current = run(args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(current, f, indent=4)
+    over = [name for name, seconds in current["results"].items()
+            if name.startswith("import/") and seconds * 1000 > args.import_budget]
+    for name in over:
+        print(f"{name} took {current['results'][name] * 1000:.1f} ms, over the {args.import_budget:g} ms budget")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.threshold):
+            sys.exit(1)
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
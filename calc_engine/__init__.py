@@ -0,0 +1,52 @@
+# Calculator engine shared by the scripts in this repo: the expression
+# compiler and VM, numeric modes, Calculator, history backends, result
+# cache, and the batch / worker pool / service runners.
+#
+# Importing the package does no work: each name below loads its submodule
+# the first time it is used, so e.g. the service (asyncio) or the worker
+# pool (multiprocessing) cost nothing unless asked for.
+import importlib
+
+_EXPORTS = {
+    "expression": [
+        "normalize_expression", "CostModel", "cost_model", "set_result_budget",
+        "exponent_too_large", "compile_code", "optimize_code", "execute", "run_with_ops",
+        "CompiledExpression", "compile_expression", "compile_cache_info",
+        "clear_compile_cache", "safe_eval", "vector_eval", "FUNCTIONS",
+    ],
+    "render": ["digit_count", "leading_digits", "render_number", "full_decimal"],
+    "factorial": ["FactorialEngine", "factorial_engine"],
+    "numeric": ["MODES", "DEFAULT_PRECISION", "NumericMode", "numeric_mode"],
+    "bases": ["to_base", "from_base", "to_base_many", "from_base_many"],
+    "results": ["ResultCache", "set_result_cache", "encode_result", "decode_result",
+                "eval_key", "call_key"],
+    "variables": ["parse_assignment", "VariableGraph"],
+    "calculator": ["Calculator", "run_calc"],
+    "history": [
+        "HISTORY_FILE", "SESSION_ID", "make_record", "format_record", "parse_message",
+        "migrate_record", "HistoryIndex", "write_history", "merge_history",
+        "HistoryManager", "JournalHistoryManager", "BackgroundWriter", "HistoryReader",
+        "HistoryBuffer", "HISTORY_MEMORY_RECORDS",
+    ],
+    "instrumentation": ["Instrumentation", "instrumentation", "cprofile_hook"],
+    "batch": ["BATCH_OPS", "batch_line", "run_batch", "batch_main",
+              "MENU_OPERATIONS", "MENU_BATCH_OPS", "menu_line", "menu_choice"],
+    "pool": ["JobPool"],
+    "service": ["serve"],
+}
+_HOMES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = sorted(_HOMES)
+
+
+def __getattr__(name):
+    module = _HOMES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_HOMES))
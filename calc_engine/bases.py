@@ -0,0 +1,188 @@
+import math
+
+from .render import full_decimal
+
+# Base conversion for bases 2-36 (digits 0-9a-z) and 64 (base64 of the
+# magnitude's big-endian bytes), in both directions.
+#
+# Power-of-two bases are linear and go through the builtins.  Other bases
+# split the number on a cached table of powers base**(LEAF * 2**k): output
+# divides by them (recursive division, so the split costs a few big
+# multiplies instead of a schoolbook divmod) and parsing multiplies by them,
+# which is Karatsuba for big ints.  Both avoid str()/int()'s quadratic
+# path and its 4300-digit limit.  Base 10 output uses full_decimal, whose
+# Decimal arithmetic is faster still.
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE64 = 64
+_BUILTIN_FORMATS = {2: "b", 8: "o", 16: "x"}
+_LEAF_BITS = 1024  # leaves below this many bits use plain divmod / int()
+_DIV_LIMIT = 8192  # recursive division hands over to divmod below this
+_INT_DIGITS = 2000  # int() is quicker than splitting below this (and under its limit)
+
+_leaf_digits = {}
+_powers = {}  # base -> [base**(leaf * 2**k) for k = 0, 1, ...]
+_pair_tables = {}
+
+
+def check_base(base):
+    if base != BASE64 and not 2 <= base <= 36:
+        raise ValueError(f"unsupported base {base} (use 2-36 or 64)")
+
+
+def _leaf(base):
+    digits = _leaf_digits.get(base)
+    if digits is None:
+        digits = _leaf_digits[base] = max(1, int(_LEAF_BITS / math.log2(base)))
+    return digits
+
+
+def _power(base, k):
+    table = _powers.setdefault(base, [])
+    while len(table) <= k:
+        table.append(base ** _leaf(base) if not table else table[-1] * table[-1])
+    return table[k]
+
+
+def _pairs(base):
+    # all two-digit strings, indexed by value
+    table = _pair_tables.get(base)
+    if table is None:
+        table = _pair_tables[base] = [DIGITS[i] + DIGITS[j] for i in range(base) for j in range(base)]
+    return table
+
+
+def _div2n1n(a, b, n):
+    # (a // b, a % b) for an n-bit b and a < 2**n * b, by splitting into
+    # halves (Burnikel-Ziegler), so the work is big multiplies
+    if n <= _DIV_LIMIT:
+        return divmod(a, b)
+    pad = n & 1
+    if pad:
+        a <<= 1
+        b <<= 1
+        n += 1
+    half = n >> 1
+    mask = (1 << half) - 1
+    b1, b2 = b >> half, b & mask
+    q1, r = _div3n2n(a >> n, (a >> half) & mask, b, b1, b2, half)
+    q2, r = _div3n2n(r, a & mask, b, b1, b2, half)
+    if pad:
+        r >>= 1
+    return q1 << half | q2, r
+
+
+def _div3n2n(a12, a3, b, b1, b2, n):
+    if a12 >> n == b1:
+        q, r = (1 << n) - 1, a12 - (b1 << n) + b1
+    else:
+        q, r = _div2n1n(a12, b1, n)
+    r = (r << n | a3) - q * b2
+    while r < 0:
+        q -= 1
+        r += b
+    return q, r
+
+
+def _leaf_to_digits(x, base):
+    # two digits per divmod; may carry one leading zero
+    pairs = _pairs(base)
+    square = base * base
+    chunk = []
+    while x:
+        x, pair = divmod(x, square)
+        chunk.append(pairs[pair])
+    return "".join(reversed(chunk))
+
+
+def _to_digits(x, base, k, out):
+    # exactly leaf * 2**k digits of x (< base**(leaf * 2**k)), zero-padded
+    width = _leaf(base) << k
+    if x == 0:
+        out.append("0" * width)
+    elif k == 0:
+        out.append(_leaf_to_digits(x, base)[-width:].rjust(width, "0"))
+    else:
+        power = _power(base, k - 1)
+        high, low = _div2n1n(x, power, power.bit_length())
+        _to_digits(high, base, k - 1, out)
+        _to_digits(low, base, k - 1, out)
+
+
+def to_base(n, base):
+    # digits only, no prefix; '-' for negatives
+    check_base(base)
+    n = int(n)
+    if base == 10:
+        return full_decimal(n)
+    sign = "-" if n < 0 else ""
+    n = abs(n)
+    if base == BASE64:
+        import base64
+        return sign + base64.b64encode(n.to_bytes(max(1, (n.bit_length() + 7) // 8), "big")).decode()
+    if base in _BUILTIN_FORMATS:
+        return sign + format(n, _BUILTIN_FORMATS[base])
+    if n < base:
+        return sign + DIGITS[n]
+    k = 0
+    while _power(base, k) <= n:
+        k += 1
+    out = []
+    _to_digits(n, base, k, out)
+    return sign + ("".join(out).lstrip("0") or "0")
+
+
+def _from_digits(text, base):
+    if len(text) <= _INT_DIGITS:
+        return int(text, base)
+    leaf = _leaf(base)
+    k = 0
+    while leaf << (k + 1) < len(text):
+        k += 1
+    split = len(text) - (leaf << k)
+    return _from_digits(text[:split], base) * _power(base, k) + _from_digits(text[split:], base)
+
+
+def from_base(text, base):
+    check_base(base)
+    text = text.strip()
+    sign = -1 if text[:1] == "-" else 1
+    digits = text[1:] if text[:1] in ("-", "+") else text
+    if not digits:
+        raise ValueError(f"no digits to read in base {base}")
+    if base == BASE64:
+        import base64
+        import binascii
+        try:
+            raw = base64.b64decode(digits, validate=True)
+        except binascii.Error as e:
+            raise ValueError(f"invalid base64 digits: {e}")
+        return sign * int.from_bytes(raw, "big")
+    digits = digits.lower()
+    # int() alone would also take '_' and spaces inside the pieces
+    if digits.encode("ascii", "replace").translate(None, DIGITS[:base].encode()):
+        raise ValueError(f"invalid digit for base {base} in {text!r}")
+    if base & (base - 1) == 0:
+        return sign * int(digits, base)  # linear for powers of two
+    return sign * _from_digits(digits, base)
+
+
+def to_base_many(numbers, base):
+    # One call for a whole sequence; the power table is built once and
+    # shared, small values skip the split entirely.
+    check_base(base)
+    if base == BASE64 or base in _BUILTIN_FORMATS:
+        return [to_base(n, base) for n in numbers]
+    leaf_limit = _power(base, 0)
+    out = []
+    for n in numbers:
+        n = int(n)
+        if -leaf_limit < n < leaf_limit:
+            text = _leaf_to_digits(abs(n), base).lstrip("0") or "0"
+            out.append("-" + text if n < 0 else text)
+        else:
+            out.append(to_base(n, base))
+    return out
+
+
+def from_base_many(texts, base):
+    return [from_base(text, base) for text in texts]
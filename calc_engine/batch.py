@@ -0,0 +1,166 @@
+import re
+import sys
+
+from .calculator import Calculator
+from .expression import safe_eval
+from .history import make_record
+from .render import render_number
+from .variables import parse_assignment
+
+
+# Batch mode: one expression or "op a b" per line
+BATCH_OPS = {
+    "+": "add", "add": "add",
+    "-": "subtract", "sub": "subtract",
+    "*": "multiply", "mul": "multiply",
+    "/": "divide", "div": "divide",
+    "%": "modulus", "mod": "modulus",
+    "**": "exponent", "^": "exponent", "pow": "exponent",
+    "even": "check_even_odd",
+    "pct": "percentage_of",
+    "!": "factorial", "fact": "factorial",
+    "base": "base_convert",
+    "frombase": "parse_base",
+}
+
+# The menu scripts' choices; their batch mode takes "op a b" lines with a
+# choice or one of these symbols, and plain numbers or 'ans' as operands
+MENU_OPERATIONS = {"1": "add", "2": "subtract", "3": "multiply", "4": "divide",
+                   "5": "modulus", "6": "exponent", "7": "check_even_odd"}
+MENU_BATCH_OPS = {**MENU_OPERATIONS, "+": "add", "-": "subtract", "*": "multiply", "/": "divide",
+                  "%": "modulus", "**": "exponent", "^": "exponent", "even": "check_even_odd"}
+
+
+def batch_line(calc, line):
+    assignment = parse_assignment(line)
+    if assignment is not None:
+        calc.variables.assign(*assignment, ans=calc.last_result)
+        return None, calc.variables.describe(assignment[0])
+
+    variables = calc.variables.values
+    parts = line.split()
+    name = BATCH_OPS.get(parts[0].lower()) if parts else None
+    if name == "factorial" and len(parts) == 2:
+        return calc.factorial(safe_eval(parts[1], calc.last_result, variables, calc.numbers))
+    if name == "base_convert" and len(parts) == 3:
+        return calc.base_convert(safe_eval(parts[1], calc.last_result, variables, calc.numbers), int(parts[2]))
+    if name == "parse_base" and len(parts) == 3:
+        return calc.parse_base(parts[1], int(parts[2]))
+    if name and len(parts) == 3:
+        a = safe_eval(parts[1], calc.last_result, variables, calc.numbers)
+        b = safe_eval(parts[2], calc.last_result, variables, calc.numbers)
+        return getattr(calc, name)(a, b)
+
+    val = safe_eval(line, calc.last_result, variables, calc.numbers)
+    calc.last_result = val
+    return val, f"Expression = {render_number(val)}"
+
+
+def _menu_number(calc, text):
+    if text.lower() == "ans":
+        if calc.last_result is None:
+            raise ValueError("no previous result for 'ans'")
+        return calc.last_result
+    return calc.number(text)
+
+
+def menu_line(calc, line, ops=MENU_BATCH_OPS):
+    parts = line.split()
+    if len(parts) != 3:
+        raise ValueError("expected 'op a b'")
+    name = ops.get(parts[0].lower())
+    if name is None:
+        raise ValueError(f"unknown operation '{parts[0]}'")
+    a, b = _menu_number(calc, parts[1]), _menu_number(calc, parts[2])
+    return getattr(calc, name)(a, b)
+
+
+def _show_result(choice, a, b, result, message):
+    print("Result:", message)
+
+
+def _record_result(choice, a, b, result, message):
+    return make_record(MENU_OPERATIONS[choice], [a, b], result, message)
+
+
+def menu_choice(calc, choice, a, b, history, show=_show_result, record=_record_result):
+    # One menu calculation. Each script has its own rules: show() prints it,
+    # record() returns what goes into history (None for nothing).
+    result, message = getattr(calc, MENU_OPERATIONS[choice])(a, b)
+    show(choice, a, b, result, message)
+    entry = record(choice, a, b, result, message)
+    if entry is not None:
+        history.append(entry)
+    return result, message
+
+
+def run_batch(lines, out, calc=None, pool=None, window=256, line_rule=batch_line):
+    # line_rule(calc, line) -> (result, message); the pool only runs batch_line
+    calc = calc or Calculator()
+    if pool is not None and line_rule is batch_line:
+        return _run_batch_pooled(lines, out, calc, pool, window)
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            result, message = line_rule(calc, line)
+        except Exception as e:
+            message = f"line {lineno}: error: {e}"
+        out.write(message + "\n")
+    return calc
+
+
+def _run_batch_pooled(lines, out, calc, pool, window):
+    # Lines without 'ans' or variables don't depend on each other, so they
+    # fan out across the pool; other lines wait for everything before them
+    # and run here, where the session's variables live.
+    pending = []
+
+    def drain():
+        jobs = [("line", line, calc.last_result) for _, line in pending]
+        for (lineno, _), outcome in zip(pending, pool.map(jobs)):
+            if isinstance(outcome, Exception):
+                out.write(f"line {lineno}: error: {outcome}\n")
+                continue
+            result, message, last = outcome
+            if last is not None:
+                calc.last_result = last
+            out.write(message + "\n")
+        pending.clear()
+
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=" in line or set(_WORD_RE.findall(line)) - _BATCH_WORDS:
+            drain()
+            try:
+                result, message = batch_line(calc, line)
+            except Exception as e:
+                message = f"line {lineno}: error: {e}"
+            out.write(message + "\n")
+            continue
+        if "ans" in line:
+            drain()
+        pending.append((lineno, line))
+        if "ans" in line or len(pending) >= window:
+            drain()
+    drain()
+    return calc
+
+
+_WORD_RE = re.compile(r"(?<![\d.])[A-Za-z_]\w*")
+_BATCH_WORDS = set(BATCH_OPS) | {"ans"}
+
+
+def batch_main(path="-", pool=None, calc=None, line_rule=batch_line):
+    out = open(sys.stdout.fileno(), "w", buffering=1 << 16, closefd=False)
+    try:
+        if path == "-":
+            run_batch(sys.stdin, out, calc, pool, line_rule=line_rule)
+        else:
+            with open(path, "r") as f:
+                run_batch(f, out, calc, pool, line_rule=line_rule)
+    finally:
+        out.flush()
@@ -0,0 +1,170 @@
+import ast
+import time
+
+from . import results
+from .bases import from_base, to_base
+from .expression import cost_model, exponent_too_large
+from .factorial import factorial_engine
+from .numeric import DEFAULT_PRECISION, numeric_mode
+from .render import render_number
+from .results import call_key
+from .variables import VariableGraph
+
+
+_PREFIXES = {2: "0b", 8: "0o", 16: "0x"}
+
+
+class Calculator:
+    def __init__(self, factorials=None, mode=None, precision=DEFAULT_PRECISION):
+        # mode: "float" (default), "decimal" (at `precision` digits) or "fraction"
+        self.last_result = None
+        self.factorials = factorials or factorial_engine
+        self.numbers = numeric_mode(mode, precision)
+        self.variables = VariableGraph(self.numbers)
+        # the mode's arithmetic is picked here, once, not on every call
+        binary = self.numbers.binary
+        self._add, self._subtract, self._multiply = binary(ast.Add), binary(ast.Sub), binary(ast.Mult)
+        self._modulus, self._power = binary(ast.Mod), binary(ast.Pow)
+        if self.numbers.exact:
+            multiply = self._multiply
+            divide = self._divide = binary(ast.Div)
+            self._percent = lambda a, b: multiply(divide(a, 100), b)
+        else:
+            self._divide = lambda a, b: round(a / b, 2)
+            self._percent = lambda a, b: (a / 100.0) * b
+        self._prefix = "" if self.numbers.name == "float" else self.numbers.key + ":"
+
+    def number(self, text):
+        # user input -> a number in this calculator's mode
+        return self.numbers.parse(text)
+
+    def _store_and_format(self, result, message, update_last=True):
+        if update_last and result is not None:
+            self.last_result = result
+        return result, message
+
+    def _cached(self, name, args, compute):
+        # compute() -> (result, message), looked up in the result cache first
+        cache = results.result_cache
+        if cache is None:
+            return compute()
+        key = call_key(self._prefix + name, args)
+        hit = cache.get(key)
+        if hit is not None:
+            return self._store_and_format(*hit)
+        start = time.perf_counter()
+        result, message = compute()
+        cache.put(key, result, message, time.perf_counter() - start)
+        return result, message
+
+    def add(self, a, b):
+        result = self._add(a, b)
+        return self._store_and_format(result, f"{render_number(a)} + {render_number(b)} = {render_number(result)}")
+
+    def subtract(self, a, b):
+        result = self._subtract(a, b)
+        return self._store_and_format(result, f"{render_number(a)} - {render_number(b)} = {render_number(result)}")
+    
+    def multiply(self, a, b):
+        result = self._multiply(a, b)
+        return self._store_and_format(result, f"{render_number(a)} * {render_number(b)} = {render_number(result)}")
+    
+    def divide(self, a, b):
+        if b == 0:
+            return None, "Cannot divide by zero."
+        res = self._divide(a, b)
+        return self._store_and_format(res, f"{render_number(a)} / {render_number(b)} = {render_number(res)}")
+    
+    def modulus(self, a, b):
+        if b == 0:
+            return None, "Cannot perform modulus with zero."
+        result = self._modulus(a, b)
+        return self._store_and_format(result, f"{render_number(a)} % {render_number(b)} = {render_number(result)}")
+
+    def exponent(self, a, b):
+        try:
+            if exponent_too_large(a, b):
+                return None, f"{render_number(a)} ** {render_number(b)} = too large"
+            return self._cached("exponent", (a, b), lambda: self._exponent(a, b))
+        except OverflowError:
+            return None, f"{render_number(a)} ** {render_number(b)} = overflow error"
+        except ZeroDivisionError:
+            # 0 ** -n; float's own message is "0.0 cannot be raised to a negative power"
+            return None, f"{render_number(a)} ** {render_number(b)} = error: division by zero"
+        except ValueError as e:
+            return None, f"{render_number(a)} ** {render_number(b)} = error: {e}"    
+
+    def _exponent(self, a, b):
+        result = self._power(a, b)
+        if abs(result) > 10**100:
+            return None, f"{render_number(a)} ** {render_number(b)} = too large"
+        return self._store_and_format(result, f"{render_number(a)} ** {render_number(b)} = {render_number(result)}")
+
+    def check_even_odd(self, a, b):
+        try:
+            ea = "Even" if int(a) % 2 == 0 else "Odd"
+            eb = "Even" if int(b) % 2 == 0 else "Odd"
+            return None, f"{render_number(a)} is {ea}, {render_number(b)} is {eb}"
+        except Exception as e:
+            return None, f"Error checking even/odd: {e}"
+        
+    def percentage_of(self, a, b):
+        try:
+            result = self._percent(a, b)
+            return self._store_and_format(result, f"{render_number(a)}% of {render_number(b)} = {render_number(result)}")
+        except Exception as e:
+            return None, f"Error computing percentage: {e}"
+        
+    def factorial(self, a):
+        try:
+            n = int(a)
+            if n < 0:
+                return None, "Factorial not defined for negative numbers"
+            max_n = self.factorials.max_n
+            if n > max_n:
+                return None, f"Factorial too large: {n}! (max: {max_n})"
+            if not cost_model.allows(cost_model.factorial_bits(n)):
+                return None, f"Factorial too large: {n}! exceeds the result-size budget ({cost_model.max_bits} bits)"
+            return self._cached("factorial", (n,), lambda: self._factorial(n))
+        except Exception as e:
+            return None, f"Error computing factorial: {e}"    
+
+    def _factorial(self, n):
+        result = self.factorials.factorial(n)
+        return self._store_and_format(result, f"{n}! = {render_number(result)}")
+
+    def base_convert(self, a, base):
+        try:
+            n = int(a)
+            base = int(base)
+            if base in _PREFIXES:  # 0b / 0o / 0x, as bin/oct/hex print them
+                out = to_base(n, base)
+                out = "-" + _PREFIXES[base] + out[1:] if n < 0 else _PREFIXES[base] + out
+            else:
+                out = to_base(n, base)
+            # keep numeric last_result unchanged for base conversions
+            return None, f"{render_number(n)} in base {base} = {out}"
+        except Exception as e:
+            return None, f"Error converting base: {e}"
+
+    def parse_base(self, text, base):
+        try:
+            base = int(base)
+            text = str(text).strip()
+            digits = text.lstrip("+-")
+            if base in _PREFIXES and digits[:2].lower() == _PREFIXES[base]:
+                text = text[:len(text) - len(digits)] + digits[2:]
+            n = from_base(text, base)
+            return self._store_and_format(n, f"{text} from base {base} = {render_number(n)}")
+        except Exception as e:
+            return None, f"Error reading base: {e}"
+
+
+def run_calc(calc, pool, name, *args):
+    if pool is None:
+        return getattr(calc, name)(*args)
+    try:
+        result, message, calc.last_result = pool.call(("call", (name, args), calc.last_result))
+    except (TimeoutError, ValueError) as e:
+        return None, f"Error: {e}"
+    return result, message
@@ -0,0 +1,900 @@
+import ast
+import math
+import operator as op
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from types import MappingProxyType
+
+from . import results
+from .render import render_number
+from .results import eval_key
+
+_ALLOWED_OPS = {
+    ast.Add: op.add,
+    ast.Sub: op.sub,
+    ast.Mult: op.mul,
+    ast.Div: op.truediv,
+    ast.Mod: op.mod,
+    ast.Pow: op.pow,
+    ast.FloorDiv: op.floordiv,
+    ast.UAdd: op.pos,
+    ast.USub: op.neg,
+}
+
+# Compiled expressions, keyed by normalized expression text (most recent last)
+COMPILE_CACHE_SIZE = 512
+_compile_cache = OrderedDict()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def normalize_expression(expr):
+    return " ".join(expr.split())
+
+
+# Cost model: bound a result's size from its operands before computing it.
+# Result bit-length is also the proxy for work, since big-int multiply and
+# power cost grows with the size of what they produce.
+class CostModel:
+    def __init__(self, max_bits=1_000_000):
+        self.max_bits = max_bits
+
+    @staticmethod
+    def bits(x):
+        if isinstance(x, int):
+            return abs(x).bit_length()
+        denominator = getattr(x, "denominator", None)
+        if denominator is not None:  # Fraction
+            return abs(x.numerator).bit_length() + denominator.bit_length()
+        return 0  # floats and Decimals are fixed size
+
+    def pow_bits(self, a, b):
+        # Only exact numbers to a whole power grow without bound; floats
+        # overflow quickly and Decimals round
+        if isinstance(a, int) and isinstance(b, int):
+            if b <= 1 or abs(a) <= 1:
+                return self.bits(a)
+            return b * math.log2(abs(a))
+        if getattr(a, "denominator", None) is None or getattr(b, "denominator", None) != 1:
+            return self.bits(a)
+        return abs(int(b)) * max(1, self.bits(a))
+
+    def mul_bits(self, a, b):
+        return self.bits(a) + self.bits(b)
+
+    def factorial_bits(self, n):
+        if n < 2:
+            return 1
+        return math.lgamma(n + 1) / math.log(2)
+
+    def allows(self, bits):
+        return bits <= self.max_bits
+
+
+cost_model = CostModel()
+
+
+def set_result_budget(max_bits):
+    cost_model.max_bits = max_bits
+
+
+def _short(x):
+    if isinstance(x, int) and x.bit_length() > 256:
+        return f"<{x.bit_length()}-bit int>"
+    return str(x)
+
+
+def _budget_pow(a, b):
+    if not cost_model.allows(cost_model.pow_bits(a, b)):
+        raise ValueError(f"{_short(a)} ** {_short(b)} = too large")
+    return a ** b
+
+
+def _budget_mul(a, b):
+    if not cost_model.allows(cost_model.mul_bits(a, b)):
+        raise ValueError(f"{_short(a)} * {_short(b)} = too large")
+    return a * b
+
+
+# Result-size estimates (bits) for the functions that can grow without
+# bound; 0 when the arguments are invalid and the call will raise anyway
+def _factorial_bits(n):
+    return cost_model.factorial_bits(n) if isinstance(n, int) and n >= 0 else 0
+
+
+def _comb_bits(n, k):
+    if not isinstance(n, int) or not isinstance(k, int) or not 0 <= k <= n:
+        return 0
+    return (math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)) / math.log(2)
+
+
+def _perm_bits(n, k=None):
+    if not isinstance(n, int) or n < 0 or not (k is None or isinstance(k, int) and 0 <= k <= n):
+        return 0
+    return (math.lgamma(n + 1) - math.lgamma((0 if k is None else n - k) + 1)) / math.log(2)
+
+
+def _lcm_bits(*args):
+    return sum(map(cost_model.bits, args))
+
+
+_CALL_BITS = {"factorial": _factorial_bits, "comb": _comb_bits, "perm": _perm_bits, "lcm": _lcm_bits}
+
+
+def _budgeted(name, func):
+    bits = _CALL_BITS[name]
+
+    def call(*args):
+        if not cost_model.allows(bits(*args)):
+            raise ValueError(f"{name}({', '.join(map(_short, args))}) = too large")
+        return func(*args)
+    return call
+
+
+# Functions callable from expressions: name -> (function, fewest args, most
+# args or None for any, NumPy ufunc name or None).  Read-only; the compiler
+# looks names up here once and puts the function itself in the program.
+FUNCTIONS = MappingProxyType({
+    "sqrt": (math.sqrt, 1, 1, "sqrt"),
+    "exp": (math.exp, 1, 1, "exp"),
+    "log": (math.log, 1, 2, None),
+    "log2": (math.log2, 1, 1, "log2"),
+    "log10": (math.log10, 1, 1, "log10"),
+    "sin": (math.sin, 1, 1, "sin"),
+    "cos": (math.cos, 1, 1, "cos"),
+    "tan": (math.tan, 1, 1, "tan"),
+    "asin": (math.asin, 1, 1, "arcsin"),
+    "acos": (math.acos, 1, 1, "arccos"),
+    "atan": (math.atan, 1, 1, "arctan"),
+    "atan2": (math.atan2, 2, 2, "arctan2"),
+    "sinh": (math.sinh, 1, 1, "sinh"),
+    "cosh": (math.cosh, 1, 1, "cosh"),
+    "tanh": (math.tanh, 1, 1, "tanh"),
+    "degrees": (math.degrees, 1, 1, "degrees"),
+    "radians": (math.radians, 1, 1, "radians"),
+    "hypot": (math.hypot, 1, None, None),
+    "abs": (abs, 1, 1, "absolute"),
+    "fabs": (math.fabs, 1, 1, "fabs"),
+    "floor": (math.floor, 1, 1, "floor"),
+    "ceil": (math.ceil, 1, 1, "ceil"),
+    "trunc": (math.trunc, 1, 1, "trunc"),
+    "round": (round, 1, 2, None),
+    "isqrt": (math.isqrt, 1, 1, None),
+    "gcd": (math.gcd, 1, None, None),
+    "lcm": (_budgeted("lcm", math.lcm), 1, None, None),
+    "factorial": (_budgeted("factorial", math.factorial), 1, 1, None),
+    "comb": (_budgeted("comb", math.comb), 2, 2, None),
+    "perm": (_budgeted("perm", math.perm), 1, 2, None),
+})
+# Calls worth a result-cache lookup, like powers
+EXPENSIVE_FUNCTIONS = frozenset(_CALL_BITS)
+
+
+@lru_cache(maxsize=256, typed=True)
+def _pure_call(func, *args):
+    return func(*args)
+
+
+def _memoized(func):
+    # for calls whose arguments are all constants but too big to fold
+    return lambda *args: _pure_call(func, *args)
+
+
+def exponent_too_large(a, b, limit_digits=100):
+    # log10 of |a ** b| without computing it; floats are left to the normal check
+    if not isinstance(a, int) or not isinstance(b, int) or b <= 1 or abs(a) <= 1:
+        return False
+    return b * math.log10(abs(a)) > limit_digits + 1e-9
+
+
+# Expressions compile to a flat postfix program of (opcode, arg, kind)
+# instructions: CONST pushes arg, NAME pushes a variable, UNARY/BINARY apply
+# arg (kind is the ast operator class), CALL applies the function arg to the
+# top kind[1] values (kind is (name, argc)). Parsing is an iterative
+# shunting-yard over tokens, so there is no recursion at any depth; Python's
+# own ast.parse overflows the stack on long generated chains.
+CONST, NAME, UNARY, BINARY, STORE, LOAD, CALL = range(7)
+
+# token -> (precedence, right associative, ast operator class)
+_BINARY_TOKENS = {
+    "+": (1, False, ast.Add),
+    "-": (1, False, ast.Sub),
+    "*": (2, False, ast.Mult),
+    "/": (2, False, ast.Div),
+    "//": (2, False, ast.FloorDiv),
+    "%": (2, False, ast.Mod),
+    "**": (4, True, ast.Pow),
+}
+_UNARY_TOKENS = {"+": ast.UAdd, "-": ast.USub}
+_UNARY_PRECEDENCE = 3  # binds tighter than * but looser than ** on its right
+
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<number>(?:0[xXoObB][0-9a-fA-F_]+|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][-+]?\d[\d_]*)?)[jJ]?)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>\*\*|//|<<|>>|<=|>=|==|!=|[-+*/%()<>&|^~@,=])
+  | (?P<string>['"])
+  | (?P<other>\S)
+)""", re.VERBOSE)
+
+
+def _instruction_func(kind, mode=None):
+    if mode is not None:
+        return mode.ops[kind]
+    if kind is ast.Pow:
+        return _budget_pow
+    if kind is ast.Mult:
+        return _budget_mul
+    return _ALLOWED_OPS[kind]
+
+
+def _number(text, parse=None):
+    # int()/float() take Python's literal forms (prefixes, underscores,
+    # no leading zeros), without compiling each literal
+    if text[-1] in "jJ":
+        raise ValueError("Only numeric constants are allowed")
+    try:
+        if text[:2].lower() in ("0x", "0o", "0b") or not any(c in text for c in ".eE"):
+            return int(text, 0)
+        value = float(text)
+    except ValueError:
+        raise ValueError(f"Syntax error: invalid number '{text}'")
+    return value if parse is None else parse(text.replace("_", ""))
+
+
+def _tokenize(expr, parse=None):
+    # -> [(kind, value)]; parse, when given, reads non-integer literals from
+    # their text (so an exact mode sees 0.1, not the float nearest to it).
+    # One findall scans the whole text; every non-space character is in
+    # some token, so nothing is skipped.
+    tokens = []
+    append = tokens.append
+    for number, name, op, string, other in _TOKEN_RE.findall(expr):
+        if number:
+            append(("number", _number(number, parse)))
+        elif name:
+            append(("name", name))
+        elif op:
+            append(("op", op))
+        elif string:
+            raise ValueError("Only numeric constants are allowed")
+        else:
+            raise ValueError(f"Syntax error: unexpected character '{other}'")
+    return tokens
+
+
+def _emit_operator(code, entry, mode=None):
+    kind = entry[2]
+    code.append((UNARY if entry[0] == "unary" else BINARY, _instruction_func(kind, mode), kind))
+
+
+def _emit_call(code, entry, mode=None):
+    # entry is ["(", name, argc]; arity is checked here, once
+    _, name, argc = entry
+    spec = FUNCTIONS.get(name)
+    if spec is None:
+        raise ValueError(f"Unknown function '{name}'")
+    func, low, high, _ = spec
+    if argc < low or (high is not None and argc > high):
+        expected = low if low == high else f"{low} or more" if high is None else f"{low} to {high}"
+        plural = "" if expected == 1 else "s"
+        raise ValueError(f"{name}() takes {expected} argument{plural} ({argc} given)")
+    if mode is not None:
+        func = mode.functions[name]
+    code.append((CALL, func, (name, argc)))
+
+
+def compile_code(expr: str, mode=None):
+    # Returns (code, names) for an expression using the _ALLOWED_OPS and
+    # FUNCTIONS whitelists; an exact NumericMode compiles its constants and
+    # operations to that mode's numbers instead
+    code = []
+    names = []
+    stack = []  # ("unary"|"binary", precedence, kind), ("(",) or ["(", function, argc]
+    expect_operand = True
+    pending = None  # a name, until the next token says variable or call
+    for kind, value in _tokenize(expr, mode and mode.parse):
+        if pending is not None:
+            if value == "(":
+                stack.append(["(", pending, 1])
+                pending = None
+                expect_operand = True
+                continue
+            code.append((NAME, pending, None))
+            if pending not in names:
+                names.append(pending)
+            pending = None
+        if expect_operand:
+            if kind == "number":
+                code.append((CONST, value if mode is None else mode.convert(value), None))
+                expect_operand = False
+            elif kind == "name":
+                pending = value
+                expect_operand = False
+            elif value == "(":
+                stack.append(("(",))
+            elif value in _UNARY_TOKENS:
+                stack.append(("unary", _UNARY_PRECEDENCE, _UNARY_TOKENS[value]))
+            else:
+                raise ValueError(f"Syntax error: unexpected '{value}'")
+        elif kind == "op" and value in _BINARY_TOKENS:
+            precedence, right_assoc, op_kind = _BINARY_TOKENS[value]
+            while stack and stack[-1][0] != "(":
+                top = stack[-1][1]
+                if top > precedence or (top == precedence and not right_assoc):
+                    _emit_operator(code, stack.pop(), mode)
+                else:
+                    break
+            stack.append(("binary", precedence, op_kind))
+            expect_operand = True
+        elif value == ")":
+            while stack and stack[-1][0] != "(":
+                _emit_operator(code, stack.pop(), mode)
+            if not stack:
+                raise ValueError("Syntax error: unmatched ')'")
+            entry = stack.pop()
+            if len(entry) == 3:
+                _emit_call(code, entry, mode)
+        elif value == ",":
+            while stack and stack[-1][0] != "(":
+                _emit_operator(code, stack.pop(), mode)
+            if not stack or len(stack[-1]) != 3:
+                raise ValueError("Syntax error: ',' outside a function call")
+            stack[-1][2] += 1
+            expect_operand = True
+        elif kind == "op":
+            raise ValueError(f"Operator '{value}' not allowed")
+        else:
+            raise ValueError(f"Syntax error: unexpected '{value}'")
+
+    if pending is not None:
+        code.append((NAME, pending, None))
+        if pending not in names:
+            names.append(pending)
+    if expect_operand:
+        raise ValueError("Syntax error: incomplete expression")
+    while stack:
+        entry = stack.pop()
+        if entry[0] == "(":
+            raise ValueError("Syntax error: '(' was never closed")
+        _emit_operator(code, entry, mode)
+    return code, names
+
+
+# Optimizer: value-numbers the program so identical subexpressions become
+# one node, folds subtrees whose inputs are all constants, and re-emits the
+# program with STORE/LOAD slots for shared subexpressions.
+FOLD_MAX_BITS = 4096  # larger constant results are left to runtime
+_OP_SYMBOLS = {
+    ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.FloorDiv: "//",
+    ast.Mod: "%", ast.Pow: "**", ast.UAdd: "+", ast.USub: "-",
+}
+
+
+def _clip(text, width=60):
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def _fold(kind, func, values):
+    if kind is ast.Pow and cost_model.pow_bits(*values) > FOLD_MAX_BITS:
+        return None
+    if kind is ast.Mult and cost_model.mul_bits(*values) > FOLD_MAX_BITS:
+        return None
+    if type(kind) is tuple and kind[0] in _CALL_BITS and _CALL_BITS[kind[0]](*values) > FOLD_MAX_BITS:
+        return None
+    try:
+        result = func(*values)
+    except (ArithmeticError, ValueError, TypeError):
+        return None  # let runtime raise it as usual
+    if isinstance(result, complex) or cost_model.bits(result) > FOLD_MAX_BITS:
+        return None
+    return result
+
+
+def optimize_code(code):
+    # Returns (code, notes); notes.folded lists (text, value) for each
+    # maximal constant subtree, notes.shared (text, uses) for each reused one
+    nodes = []  # (opcode, arg, kind, children)
+    sources = {}  # node made by folding -> (opcode, kind, children) it replaced
+    numbering = {}
+    folded = {}
+    stack = []
+    for opcode, arg, kind in code:
+        if opcode == CONST:
+            entry = (CONST, arg, None, ())
+            key = (CONST, type(arg), arg if type(arg) is int else repr(arg))
+        elif opcode == NAME:
+            entry = (NAME, arg, None, ())
+            key = (NAME, arg)
+        else:
+            if opcode == BINARY:
+                right = stack.pop()
+                children = (stack.pop(), right)
+                constant = nodes[children[0]][0] == CONST and nodes[right][0] == CONST
+            elif opcode == UNARY:
+                children = (stack.pop(),)
+                constant = nodes[children[0]][0] == CONST
+            else:
+                count = kind[1]
+                children = tuple(stack[-count:])
+                del stack[-count:]
+                constant = all(nodes[c][0] == CONST for c in children)
+            if constant:
+                value = _fold(kind, arg, [nodes[c][1] for c in children])
+                if value is None and opcode == CALL:
+                    arg = _memoized(arg)  # too big to fold: compute once, then reuse
+                if value is not None:
+                    for c in children:
+                        folded.pop(c, None)
+                    key = (CONST, type(value), value if type(value) is int else repr(value))
+                    node_id = numbering.get(key)
+                    if node_id is None:
+                        node_id = numbering[key] = len(nodes)
+                        nodes.append((CONST, value, None, ()))
+                        sources[node_id] = (opcode, kind, children)
+                    folded[node_id] = (opcode, kind, children)
+                    stack.append(node_id)
+                    continue
+            entry = (opcode, arg, kind, children)
+            key = (opcode, kind, children)
+        node_id = numbering.get(key)
+        if node_id is None:
+            node_id = numbering[key] = len(nodes)
+            nodes.append(entry)
+        stack.append(node_id)
+
+    root = stack[0]
+    uses = [0] * len(nodes)
+    uses[root] = 1
+    for node_id in range(len(nodes) - 1, -1, -1):
+        if uses[node_id]:
+            for child in nodes[node_id][3]:
+                uses[child] += 1
+
+    new_code = []
+    slots = {}
+    shared = []
+    todo = [(root, False)]
+    while todo:
+        node_id, visited = todo.pop()
+        opcode, arg, kind, children = nodes[node_id]
+        if node_id in slots:
+            new_code.append((LOAD, slots[node_id], None))
+        elif not children:
+            new_code.append((opcode, arg, kind))
+        elif not visited:
+            todo.append((node_id, True))
+            for child in reversed(children):
+                todo.append((child, False))
+        else:
+            new_code.append((opcode, arg, kind))
+            if uses[node_id] > 1:
+                slots[node_id] = len(slots)
+                new_code.append((STORE, None, None))
+                shared.append((node_id, uses[node_id]))
+    return new_code, _OptimizerNotes(nodes, sources, folded, shared)
+
+
+class _OptimizerNotes:
+    # What optimize_code did.  The display text is only built when a report
+    # is asked for, so compiling doesn't pay for it.
+    __slots__ = ("_nodes", "_sources", "_folded", "_shared", "_lists")
+
+    def __init__(self, nodes, sources, folded, shared):
+        self._nodes, self._sources, self._folded, self._shared = nodes, sources, folded, shared
+        self._lists = None
+
+    @property
+    def folded(self):
+        return self._describe()[0]
+
+    @property
+    def shared(self):
+        return self._describe()[1]
+
+    def _describe(self):
+        if self._lists is None:
+            texts = []
+
+            def show(opcode, kind, children):
+                if opcode == CALL:
+                    return _clip(f"{kind[0]}({', '.join(texts[c] for c in children)})")
+                if len(children) == 2:
+                    return _clip(f"({texts[children[0]]} {_OP_SYMBOLS[kind]} {texts[children[1]]})")
+                return _clip(f"{_OP_SYMBOLS[kind]}{texts[children[0]]}")
+
+            # children always come before their parents
+            for node_id, (opcode, arg, kind, children) in enumerate(self._nodes):
+                if node_id in self._sources:
+                    texts.append(show(*self._sources[node_id]))
+                elif opcode == CONST:
+                    texts.append(render_number(arg))
+                elif opcode == NAME:
+                    texts.append(arg)
+                else:
+                    texts.append(show(opcode, kind, children))
+            folded = [(show(*source), self._nodes[node_id][1]) for node_id, source in self._folded.items()]
+            shared = [(texts[node_id], uses) for node_id, uses in self._shared]
+            self._lists = (folded, shared)
+            self._nodes = self._sources = self._folded = self._shared = None
+        return self._lists
+
+
+def execute(code, ans=None, env=None):
+    stack = []
+    slots = []
+    push = stack.append
+    pop = stack.pop
+    for opcode, arg, kind in code:
+        if opcode == BINARY:
+            right = pop()
+            stack[-1] = arg(stack[-1], right)
+        elif opcode == CONST:
+            push(arg)
+        elif opcode == NAME:
+            if arg == "ans":
+                if ans is None:
+                    raise ValueError("No last result available (ans)")
+                push(ans)
+            elif env is not None and arg in env:
+                push(env[arg])
+            else:
+                raise ValueError(f"Use of name '{arg}' is not allowed")
+        elif opcode == UNARY:
+            stack[-1] = arg(stack[-1])
+        elif opcode == CALL:
+            argc = kind[1]
+            args = stack[-argc:]
+            del stack[-argc:]
+            push(arg(*args))
+        elif opcode == LOAD:
+            push(slots[arg])
+        else:
+            slots.append(stack[-1])
+    return stack[0]
+
+
+def run_with_ops(code, env, ops):
+    # Same program, with each operator kind swapped for ops[kind] (e.g. NumPy)
+    stack = []
+    slots = []
+    for opcode, arg, kind in code:
+        if opcode == BINARY:
+            right = stack.pop()
+            stack[-1] = ops[kind](stack[-1], right)
+        elif opcode == CONST:
+            stack.append(arg)
+        elif opcode == NAME:
+            if arg not in env:
+                if arg == "ans":
+                    raise ValueError("No last result available (ans)")
+                raise ValueError(f"Use of name '{arg}' is not allowed")
+            stack.append(env[arg])
+        elif opcode == UNARY:
+            stack[-1] = ops[kind](stack[-1])
+        elif opcode == CALL:
+            argc = kind[1]
+            args = stack[-argc:]
+            del stack[-argc:]
+            stack.append(ops.get(kind[0], arg)(*args))
+        elif opcode == LOAD:
+            stack.append(slots[arg])
+        else:
+            slots.append(stack[-1])
+    return stack[0]
+
+
+# Exact modes keep a native twin of an integer-only program: with int
+# inputs it gives the exact answer at native speed.  A negative power is
+# the one way ints leave the integers, so it abandons the fast path.
+class _NotWhole(ArithmeticError):
+    pass
+
+
+def _whole_pow(a, b):
+    if b < 0:
+        raise _NotWhole(f"{_short(a)} ** {_short(b)} is not whole")
+    return _budget_pow(a, b)
+
+
+def _fast_code(code, whole_functions):
+    # The native program with whole powers, or None if it can leave the ints
+    fast = []
+    for opcode, arg, kind in code:
+        if opcode == CONST and type(arg) is not int:
+            return None
+        if opcode == BINARY and kind is ast.Div:
+            return None
+        if opcode == CALL and kind[0] not in whole_functions:
+            return None
+        fast.append((opcode, _whole_pow if kind is ast.Pow else arg, kind))
+    return fast
+
+
+# Expressions this long, or with a power left after folding, go through the
+# persistent result cache (when one is open); anything cheaper is faster to
+# recompute than to look up
+RESULT_CACHE_MIN_CODE = 64
+
+
+def _cacheable(code):
+    return (len(code) >= RESULT_CACHE_MIN_CODE
+            or any(kind is ast.Pow or opcode == CALL and kind[0] in EXPENSIVE_FUNCTIONS
+                   for opcode, _, kind in code))
+
+
+class CompiledExpression:
+    # Tiered: a new expression first runs as parsed, since most long
+    # generated ones are seen once; optimize_code runs when it is used
+    # again (a compile-cache hit or a second call).  Folding and sharing
+    # don't change results, only how fast repeats are.
+    __slots__ = ("text", "code", "names", "free_names", "notes", "cacheable",
+                 "mode", "fast_code", "uses_ans", "stage")
+
+    def __init__(self, text, code, names, mode=None, fast_code=None):
+        self.text = text
+        self.code = code
+        self.names = names
+        self.free_names = [name for name in names if name != "ans"]
+        self.notes = None  # optimize_code's notes, for report()
+        self.cacheable = _cacheable(code)
+        self.mode = mode  # None for float, else an exact NumericMode
+        self.fast_code = fast_code
+        self.uses_ans = "ans" in names
+        self.stage = 0  # 0 new, 1 run once as parsed, 2 optimized
+
+    def optimize(self):
+        if self.stage == 2:
+            return self
+        self.code, self.notes = optimize_code(self.code)
+        if self.fast_code is not None:
+            self.fast_code = optimize_code(self.fast_code)[0]
+        self.cacheable = _cacheable(self.code)
+        self.stage = 2
+        return self
+
+    def __call__(self, ans=None, env=None):
+        if self.stage < 2:
+            if self.stage:
+                self.optimize()
+            else:
+                self.stage = 1
+        if self.mode is None:
+            try:
+                return execute(self.code, ans, env)
+            except ZeroDivisionError:
+                raise ZeroDivisionError("division by zero") from None
+        # inputs are looked at once per call, not per operation
+        fast = self.fast_code
+        if fast is not None and (type(ans) is int or not self.uses_ans):
+            for name in self.free_names:
+                if not env or type(env.get(name)) is not int:
+                    fast = None
+                    break
+            if fast is not None:
+                try:
+                    return execute(fast, ans, env)
+                except _NotWhole:
+                    pass
+                except ArithmeticError as e:
+                    raise self.mode.error(e) from None
+        convert = self.mode.convert
+        if self.uses_ans and ans is not None:
+            ans = convert(ans)
+        if env and self.free_names:
+            env = {name: convert(env[name]) for name in self.free_names if name in env}
+        try:
+            return execute(self.code, ans, env)
+        except ArithmeticError as e:
+            raise self.mode.error(e) from None
+
+    @property
+    def folded(self):
+        return self.optimize().notes.folded
+
+    @property
+    def shared(self):
+        return self.optimize().notes.shared
+
+    def report(self):
+        lines = [f"folded {text} -> {render_number(value)}" for text, value in self.folded]
+        lines += [f"shared {text} ({uses} uses)" for text, uses in self.shared]
+        return lines
+
+
+def _resolve_mode(mode):
+    # None for float, so the float path never changes; else the NumericMode
+    if mode is None or mode == "float":
+        return None
+    if isinstance(mode, str):
+        from .numeric import numeric_mode
+        mode = numeric_mode(mode)
+    return mode if mode.exact else None
+
+
+def compile_expression(expr: str, mode=None):
+    # mode: None / "float", "decimal", "fraction" or a NumericMode
+    mode = _resolve_mode(mode)
+    text = normalize_expression(expr)
+    key = text if mode is None else (mode.key, text)
+    compiled = _compile_cache.get(key)
+    if compiled is not None:
+        _compile_cache.move_to_end(key)
+        _cache_stats["hits"] += 1
+        return compiled if compiled.stage == 2 else compiled.optimize()
+
+    _cache_stats["misses"] += 1
+    if mode is None:
+        code, names = compile_code(text)
+        compiled = CompiledExpression(text, code, names)
+    else:
+        from .numeric import WHOLE_FUNCTIONS
+        code, names = compile_code(text, mode)
+        fast = _fast_code(compile_code(text)[0], WHOLE_FUNCTIONS)
+        compiled = CompiledExpression(text, code, names, mode, fast)
+
+    _compile_cache[key] = compiled
+    if len(_compile_cache) > COMPILE_CACHE_SIZE:
+        _compile_cache.popitem(last=False)
+    return compiled
+
+
+def compile_cache_info():
+    return {
+        "hits": _cache_stats["hits"],
+        "misses": _cache_stats["misses"],
+        "size": len(_compile_cache),
+        "maxsize": COMPILE_CACHE_SIZE,
+    }
+
+
+def clear_compile_cache():
+    _compile_cache.clear()
+    _cache_stats["hits"] = 0
+    _cache_stats["misses"] = 0
+
+
+def safe_eval(expr: str, last_result=None, variables=None, mode=None):
+
+    if expr is None:
+        raise ValueError("No expression provided")
+
+    expr = expr.strip()
+    if expr.lower() == "ans":
+        if last_result is None:
+            raise ValueError("No last result available (ans)")
+        return last_result
+
+    compiled = compile_expression(expr, mode)
+    if compiled.free_names:
+        if variables is None:
+            raise ValueError(f"Use of name '{compiled.free_names[0]}' is not allowed")
+        for name in compiled.free_names:
+            if name not in variables:
+                raise ValueError(f"Variable '{name}' is not defined")
+    cache = results.result_cache
+    if cache is None or not compiled.cacheable:
+        if compiled.mode is None:
+            try:
+                return execute(compiled.code, last_result, variables)
+            except ZeroDivisionError:
+                # the same message as NumericMode.error gives the exact modes
+                raise ZeroDivisionError("division by zero") from None
+        return compiled(last_result, variables)
+    key = eval_key(compiled, last_result, variables)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit[0]
+    start = time.perf_counter()
+    result = compiled(last_result, variables)
+    cache.put(key, result, None, time.perf_counter() - start)
+    return result
+
+
+# Vectorized evaluation: one expression over whole arrays of inputs (needs NumPy)
+EXPONENT_LIMIT = 10**100
+
+
+def _checked_pow(a, b):
+    if exponent_too_large(a, b):
+        raise ValueError(f"{_short(a)} ** {_short(b)} = too large")
+    result = a ** b
+    if abs(result) > EXPONENT_LIMIT:
+        raise ValueError(f"{a} ** {b} = too large")
+    return result
+
+
+def _numpy_ops(np, bad):
+    # Elements that the scalar Calculator would refuse are flagged in `bad`
+    def guard_zero(func):
+        def apply(a, b):
+            np.logical_or(bad, np.equal(b, 0), out=bad)
+            return func(a, b)
+        return apply
+
+    def power(a, b):
+        result = np.power(a, b)
+        np.logical_or(bad, ~np.isfinite(result), out=bad)
+        np.logical_or(bad, np.abs(result) > EXPONENT_LIMIT, out=bad)
+        return result
+
+    ops = {
+        ast.Add: np.add,
+        ast.Sub: np.subtract,
+        ast.Mult: np.multiply,
+        ast.Div: guard_zero(np.true_divide),
+        ast.Mod: guard_zero(np.mod),
+        ast.FloorDiv: guard_zero(np.floor_divide),
+        ast.Pow: power,
+        ast.UAdd: np.positive,
+        ast.USub: np.negative,
+    }
+    for name, (func, _, _, ufunc) in FUNCTIONS.items():
+        ops[name] = _numpy_call(np, bad, getattr(np, ufunc) if ufunc else None, func)
+    return ops
+
+
+def _numpy_call(np, bad, ufunc, func):
+    # A ufunc where NumPy has one, else func applied element by element;
+    # either way, elements the scalar call would refuse are flagged in `bad`
+    def apply(*args):
+        if ufunc is not None:
+            result = ufunc(*args)
+        else:
+            arrays = np.broadcast_arrays(*args)
+            result = np.empty(arrays[0].shape, dtype=np.float64)
+            for i, values in enumerate(zip(*(a.ravel() for a in arrays))):
+                # whole floats as ints, for factorial, gcd and the like
+                values = [v.item() for v in values]
+                values = [int(v) if isinstance(v, float) and v.is_integer() else v for v in values]
+                try:
+                    result.flat[i] = func(*values)
+                except (ArithmeticError, ValueError, TypeError):
+                    result.flat[i] = np.nan
+        np.logical_or(bad, ~np.isfinite(result), out=bad)
+        return result
+    return apply
+
+
+def vector_eval(expr: str, ans=None, exact=False, **inputs):
+    # Returns (values, errors): errors is a boolean mask of elements where the
+    # scalar path would have refused (divide by zero, too large, overflow).
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("vector_eval needs NumPy: pip install numpy")
+
+    code = compile_expression(expr).code
+    if ans is not None:
+        inputs["ans"] = ans
+    env = {name: np.asarray(values) for name, values in inputs.items()}
+    shape = np.broadcast_shapes(*(a.shape for a in env.values()))
+
+    # Python ints beyond int64 (object arrays) or exact int work use the scalar path
+    if exact or any(a.dtype == object for a in env.values()):
+        return _scalar_vector_eval(code, env, shape, np)
+
+    env = {name: a.astype(np.float64) for name, a in env.items()}
+    bad = np.zeros(shape, dtype=bool)
+    with np.errstate(all="ignore"):
+        values = run_with_ops(code, env, _numpy_ops(np, bad))
+    values = np.where(bad, np.nan, np.broadcast_to(values, shape))
+    return values, bad
+
+
+def _scalar_vector_eval(code, env, shape, np):
+    ops = dict(_ALLOWED_OPS)
+    ops[ast.Pow] = _checked_pow
+    columns = {name: np.broadcast_to(a, shape).ravel() for name, a in env.items()}
+    count = int(np.prod(shape))
+    values = np.empty(count, dtype=object)
+    bad = np.zeros(count, dtype=bool)
+    for i in range(count):
+        row = {name: col[i].item() if hasattr(col[i], "item") else col[i]
+               for name, col in columns.items()}
+        try:
+            values[i] = run_with_ops(code, row, ops)
+        except (ArithmeticError, ValueError):
+            values[i] = None
+            bad[i] = True
+    return values.reshape(shape), bad.reshape(shape)
@@ -0,0 +1,89 @@
+import bisect
+import math
+import os
+from collections import OrderedDict
+
+# Factorials: a bounded memo of checkpoints, each new value built from the
+# nearest cached one. Big jumps go to math.factorial, which is itself a
+# split-recursive (binary splitting) product in C.
+def _range_product(lo, hi):
+    if hi - lo < 16:
+        result = 1
+        for i in range(lo, hi + 1):
+            result *= i
+        return result
+    mid = (lo + hi) // 2
+    return _range_product(lo, mid) * _range_product(mid + 1, hi)
+
+
+class FactorialEngine:
+    JUMP_FRACTION = 0.25  # beyond this, incremental loses to a full computation
+    MAX_DOWN_STEPS = 32
+
+    def __init__(self, max_n=5000, memo_size=64, memo_bits=64_000_000, path=None):
+        self.max_n = max_n
+        self.memo_size = memo_size
+        self.memo_bits = memo_bits
+        self.path = path
+        self._memo = OrderedDict()
+        self._keys = []
+        self._bits = 0
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load(path)
+
+    def factorial(self, n):
+        if n < 0:
+            raise ValueError("Factorial not defined for negative numbers")
+        if n in self._memo:
+            self._memo.move_to_end(n)
+            self.hits += 1
+            return self._memo[n]
+        self.misses += 1
+
+        i = bisect.bisect_left(self._keys, n)
+        below = self._keys[i - 1] if i > 0 else None
+        above = self._keys[i] if i < len(self._keys) else None
+
+        if below is not None and n - below <= max(16, n * self.JUMP_FRACTION):
+            result = self._memo[below] * _range_product(below + 1, n)
+        elif above is not None and above - n <= self.MAX_DOWN_STEPS:
+            result = self._memo[above] // _range_product(n + 1, above)
+        else:
+            result = math.factorial(n)
+        self._remember(n, result)
+        return result
+
+    def _remember(self, n, value):
+        self._memo[n] = value
+        bisect.insort(self._keys, n)
+        self._bits += value.bit_length()
+        while len(self._memo) > 1 and (len(self._memo) > self.memo_size or self._bits > self.memo_bits):
+            old, old_value = self._memo.popitem(last=False)
+            self._keys.remove(old)
+            self._bits -= old_value.bit_length()
+
+    def save(self, path=None):
+        import json  # only needed for checkpoints
+        path = path or self.path
+        try:
+            with open(path, "w") as f:
+                json.dump({str(n): format(v, "x") for n, v in self._memo.items()}, f)
+        except Exception as e:
+            print(f"Warning: failed to save factorial checkpoints: {e}")
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        import json
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+            for n, hex_value in saved.items():
+                self._remember(int(n), int(hex_value, 16))
+        except Exception as e:
+            print(f"Warning: failed to load factorial checkpoints: {e}")
+
+
+factorial_engine = FactorialEngine()
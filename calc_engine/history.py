@@ -0,0 +1,805 @@
+import bisect
+import contextlib
+import json
+import math
+import mmap
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from decimal import Decimal
+from itertools import accumulate, islice
+try:
+    import fcntl
+except ImportError:  # Windows: history locking is skipped
+    fcntl = None
+
+from .render import digit_count, full_decimal, render_number
+
+HISTORY_FILE = "shakur_history.json"
+
+# Structured history records: {"op", "operands", "result", "ts", "session"}.
+# The display string is derived from the record; "text" is only kept when it
+# can't be (errors, base conversions, even/odd checks, unparsed old lines).
+SESSION_ID = os.urandom(4).hex()
+
+_RECORD_FORMATS = {
+    "add": "{a} + {b} = {r}",
+    "subtract": "{a} - {b} = {r}",
+    "multiply": "{a} * {b} = {r}",
+    "divide": "{a} / {b} = {r}",
+    "modulus": "{a} % {b} = {r}",
+    "exponent": "{a} ** {b} = {r}",
+    "percentage_of": "{a}% of {b} = {r}",
+    "factorial": "{a}! = {r}",
+    "expression": "Expression = {r}",
+}
+_SYMBOL_OPS = {"+": "add", "-": "subtract", "*": "multiply", "/": "divide",
+               "%": "modulus", "**": "exponent"}
+
+_NUMBER = (r"-?(?:\d\.\d+e\+\d+ \(\d+ digits, ends \.\.\.\d+\)"
+           r"|\d+(?:\.\d*)?(?:e[-+]?\d+)?|inf|nan)")
+_MESSAGE_PATTERNS = [
+    (re.compile(rf"({_NUMBER}) (\*\*|[-+*/%]) ({_NUMBER}) = ({_NUMBER})"), None),
+    (re.compile(rf"({_NUMBER})% of ({_NUMBER}) = ({_NUMBER})"), "percentage_of"),
+    (re.compile(rf"(\d+)! = ({_NUMBER})"), "factorial"),
+    (re.compile(rf"Expression = ({_NUMBER})"), "expression"),
+    (re.compile(rf"({_NUMBER}) in base (\d+) = \S+"), "base_convert"),
+    (re.compile(rf"({_NUMBER}) is (?:Even|Odd), ({_NUMBER}) is (?:Even|Odd)"), "check_even_odd"),
+]
+
+
+def encode_number(x):
+    # JSON-safe form: ints past FULL_RENDER_DIGITS keep only their rendering,
+    # Decimals and Fractions (the exact numeric modes) their exact text, plus
+    # the rendering when a Fraction is too long to show
+    if isinstance(x, Decimal):
+        return {"exact": str(x)}
+    if hasattr(x, "denominator") and not isinstance(x, int):
+        exact = full_decimal(x.numerator)
+        if x.denominator != 1:
+            exact += "/" + full_decimal(x.denominator)
+        shown = render_number(x)
+        return {"exact": exact} if shown == exact else {"exact": exact, "render": shown}
+    if isinstance(x, bool) or not isinstance(x, (int, float)):
+        return None
+    if isinstance(x, int):
+        shown = render_number(x)
+        if "digits" in shown:
+            return {"digits": digit_count(x), "render": shown}
+    return x
+
+
+def decode_number(text):
+    # Inverse of render_number; ValueError unless it renders back to `text`
+    if "digits" in text:
+        return {"digits": int(text.split("(", 1)[1].split()[0]), "render": text}
+    try:
+        x = int(text)
+    except ValueError:
+        x = float(text)
+    if str(x) != text:
+        raise ValueError(f"{text!r} is not in canonical form")
+    return x
+
+
+def _show_number(x):
+    if isinstance(x, dict):
+        return x["render"] if "render" in x else x["exact"]
+    return render_number(x)
+
+
+def format_record(record):
+    if isinstance(record, str):
+        return record
+    text = record.get("text")
+    if text is not None:
+        return text
+    operands = record["operands"]
+    a = _show_number(operands[0]) if operands else ""
+    b = _show_number(operands[1]) if len(operands) > 1 else ""
+    return _RECORD_FORMATS[record["op"]].format(a=a, b=b, r=_show_number(record["result"]))
+
+
+def make_record(op, operands, result, message, ts=None, session=SESSION_ID):
+    record = {
+        "op": op,
+        "operands": [encode_number(x) for x in operands],
+        "result": encode_number(result),
+        "ts": time.time() if ts is None else ts,
+        "session": session,
+    }
+    if (record["result"] is None or op not in _RECORD_FORMATS
+            or None in record["operands"] or format_record(record) != message):
+        record["text"] = message
+    return record
+
+
+def parse_message(message, ts=None, session=None):
+    # Old free-text history line -> record
+    for pattern, op in _MESSAGE_PATTERNS:
+        m = pattern.fullmatch(message)
+        if m is None:
+            continue
+        values = list(m.groups())
+        if op is None:
+            op = _SYMBOL_OPS[values.pop(1)]
+        if op in ("base_convert", "check_even_odd"):
+            operands, result = values, None
+        else:
+            operands, result = values[:-1], values[-1]
+        try:
+            operands = [decode_number(x) for x in operands]
+            result = None if result is None else decode_number(result)
+        except ValueError:
+            break
+        # the patterns mirror _RECORD_FORMATS, so with every number in
+        # canonical form the derived string is the original message
+        record = {"op": op, "operands": operands, "result": result, "ts": ts, "session": session}
+        if result is None:
+            record["text"] = message
+        return record
+    return {"op": None, "operands": [], "result": None, "ts": ts, "session": session, "text": message}
+
+
+def migrate_record(record):
+    return parse_message(record) if isinstance(record, str) else record
+
+
+def result_key(record):
+    # Float sort key for the result-range index (None when not numeric)
+    result = record.get("result")
+    if isinstance(result, dict):
+        if "exact" in result:
+            numerator, _, denominator = result["exact"].partition("/")
+            try:
+                return float(Decimal(numerator) / Decimal(denominator or 1))
+            except ArithmeticError:
+                return -math.inf if numerator.startswith("-") else math.inf
+        return -math.inf if result["render"].startswith("-") else math.inf
+    if isinstance(result, (int, float)) and not isinstance(result, bool):
+        try:
+            return float(result)
+        except OverflowError:
+            return math.inf if result > 0 else -math.inf
+    return None
+
+
+class HistoryIndex:
+    # Secondary indexes over the records: positions by operation, and result
+    # keys kept sorted per operation (and for all records under None), so a
+    # filter or aggregate costs O(log n + matches) instead of a full scan.
+    def __init__(self, records=()):
+        self.records = []
+        self.by_op = {}
+        self._ranges = {}  # op -> [sorted keys, positions, prefix sums or None]
+        for record in records:
+            self._add(record, sort=False)
+        for entry in self._ranges.values():
+            order = sorted(range(len(entry[0])), key=entry[0].__getitem__)
+            entry[0] = [entry[0][i] for i in order]
+            entry[1] = [entry[1][i] for i in order]
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record):
+        self._add(record)
+
+    def _add(self, record, sort=True):
+        record = migrate_record(record)
+        pos = len(self.records)
+        self.records.append(record)
+        op = record.get("op")
+        self.by_op.setdefault(op, []).append(pos)
+        key = result_key(record)
+        if key is None or key != key:  # no result, or nan
+            return
+        for name in {None, op}:
+            entry = self._ranges.setdefault(name, [[], [], None])
+            i = bisect.bisect_right(entry[0], key) if sort else len(entry[0])
+            entry[0].insert(i, key)
+            entry[1].insert(i, pos)
+            entry[2] = None
+
+    def _range(self, op, low, high):
+        entry = self._ranges.get(op)
+        if entry is None:
+            return None, 0, 0
+        keys = entry[0]
+        i = 0 if low is None else bisect.bisect_left(keys, low)
+        j = len(keys) if high is None else bisect.bisect_right(keys, high)
+        return entry, i, max(i, j)
+
+    def query(self, op=None, low=None, high=None, limit=None):
+        # Records matching op and low <= result <= high, in history order
+        if low is None and high is None:
+            positions = self.by_op.get(op, []) if op is not None else range(len(self.records))
+        else:
+            entry, i, j = self._range(op, low, high)
+            positions = sorted(entry[1][i:j]) if entry else []
+        if limit is not None:
+            positions = positions[max(0, len(positions) - limit):]
+        return [self.records[p] for p in positions]
+
+    def aggregate(self, op=None, low=None, high=None):
+        entry, i, j = self._range(op, low, high)
+        count = j - i
+        if count == 0:
+            return {"count": 0, "sum": 0.0, "min": None, "max": None, "mean": None}
+        keys = entry[0]
+        if entry[2] is None:
+            entry[2] = [0.0]
+            entry[2].extend(accumulate(keys))
+        total = entry[2][j] - entry[2][i]
+        if not math.isfinite(total):
+            total = math.fsum(keys[i:j])
+        return {"count": count, "sum": total, "min": keys[i], "max": keys[j - 1],
+                "mean": total / count}
+
+
+def write_history(f, records):
+    # Same layout as json.dump(records, f, indent=4) for flat records: one
+    # record per line, which is what lets HistoryReader read from the end.
+    records = iter(records)
+    count = 0
+    while True:
+        chunk = [json.dumps(record) for record in islice(records, 4096)]
+        if not chunk:
+            break
+        f.write(",\n    " if count else "[\n    ")
+        f.write(",\n    ".join(chunk))
+        count += len(chunk)
+    f.write("\n]" if count else "[]")
+    return count
+
+
+def _record_key(record):
+    return json.dumps(record, sort_keys=True)
+
+
+def merge_history(base, mine, theirs):
+    # Three-way merge for sessions sharing a file: what is on disk now
+    # (theirs), minus the records this session dropped since it loaded
+    # `base` (a Counter of record keys), plus the ones it added.
+    mine_keys = Counter(map(_record_key, mine))
+    removed = base - mine_keys
+    added = mine_keys - base
+    merged = []
+    for record in theirs:
+        key = _record_key(record)
+        if removed[key]:
+            removed[key] -= 1
+        else:
+            merged.append(record)
+    new = []
+    for record in reversed(mine):
+        key = _record_key(record)
+        if added[key]:
+            added[key] -= 1
+            new.append(record)
+    new.reverse()
+    merged.extend(new)
+    return merged
+
+
+class HistoryManager:
+    # Several sessions may share one file: reads and writes hold an advisory
+    # lock on `filename + ".lock"`, snapshots are replaced by atomic rename,
+    # and save_history merges with the file instead of overwriting it.
+    def __init__(self, filename="shakur_history.json"):
+        self.filename = filename
+        self._base = Counter()
+
+    @contextlib.contextmanager
+    def _lock(self, shared=False):
+        if fcntl is None:  # no advisory locks on this platform
+            yield
+            return
+        with open(self.filename + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self):
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, "r") as f:
+                    return [migrate_record(r) for r in json.load(f)]
+            except Exception:
+                return []
+        return []
+
+    def load_history(self):
+        with self._lock(shared=True):
+            history = self._read()
+        self._base = Counter(map(_record_key, history))
+        return history
+
+    def _write_snapshot(self, records):
+        tmp = f"{self.filename}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            count = write_history(f, records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+        return count
+
+    def save_history(self, history):
+        try:
+            with self._lock():
+                merged = merge_history(self._base, history, self._read())
+                self._write_snapshot(merged)
+            self._base = Counter(map(_record_key, merged))
+        except Exception as e:
+            print(f"Warning: failed to save history: {e}")
+
+    def clear_history(self):
+        try:
+            with self._lock():
+                self._write_snapshot([])
+            self._base = Counter()
+        except Exception as e:
+            print(f"Warning: failed to clear history: {e}")
+
+
+class JournalHistoryManager(HistoryManager):
+    # Snapshot (JSON array) in `filename`, plus one JSON record per line
+    # appended to `filename + ".log"`.  Appends are group-committed: records
+    # collect in memory and go out `flush_every` at a time in one locked
+    # write and one fsync, so concurrent sessions interleave whole batches.
+    def __init__(self, filename="shakur_history.json", flush_every=10, fsync=True):
+        super().__init__(filename)
+        self.journal = filename + ".log"
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self._buffer = []
+
+    def _read(self):
+        history = super()._read()
+        history.extend(self._read_journal())
+        return history
+
+    def _read_journal(self):
+        records = []
+        if not os.path.exists(self.journal):
+            return records
+        with open(self.journal, "r") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # torn by a crash; the next flush cuts it off
+                try:
+                    records.append(migrate_record(json.loads(line)))
+                except ValueError:
+                    print("Warning: skipped a damaged history journal line")
+        return records
+
+    def _repair_tail(self):
+        # A crash mid-write can leave a last line without its newline; cut it off
+        with open(self.journal, "r+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                if pos == end and chunk.endswith(b"\n"):
+                    return
+                cut = chunk.rfind(b"\n")
+                if cut != -1:
+                    f.truncate(pos - step + cut + 1)
+                    return
+                pos -= step
+            f.truncate(0)
+
+    def append(self, record):
+        self._buffer.append(json.dumps(record) + "\n")
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        # swap first: the service appends from the event loop while this
+        # runs in an executor thread
+        lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        data = memoryview("".join(lines).encode())
+        try:
+            with self._lock():
+                if os.path.exists(self.journal):
+                    self._repair_tail()
+                fd = os.open(self.journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    while data:
+                        data = data[os.write(fd, data):]
+                    if self.fsync:
+                        os.fsync(fd)
+                finally:
+                    os.close(fd)
+        except Exception as e:
+            self._buffer[:0] = lines
+            print(f"Warning: failed to append history: {e}")
+
+    def close(self):
+        self.flush()
+
+    def compact(self, history=None):
+        # Without an explicit history the snapshot and journal are streamed
+        # into the new snapshot, so memory stays flat however long the
+        # history is; with one, it is merged with what is on disk.
+        self.flush()
+        count = 0
+        try:
+            with self._lock():
+                if history is None:
+                    count = self._write_snapshot(HistoryReader(self.filename, self.journal).oldest())
+                else:
+                    merged = merge_history(self._base, history, self._read())
+                    count = self._write_snapshot(merged)
+                    self._base = Counter(map(_record_key, merged))
+                if os.path.exists(self.journal):
+                    os.remove(self.journal)
+        except Exception as e:
+            print(f"Warning: failed to compact history: {e}")
+        return count
+
+    def journal_size(self):
+        try:
+            return os.path.getsize(self.journal)
+        except OSError:
+            return 0
+
+    def save_history(self, history):
+        self.compact(history)
+
+    def clear_history(self):
+        self._buffer.clear()
+        try:
+            with self._lock():
+                self._write_snapshot([])
+                if os.path.exists(self.journal):
+                    os.remove(self.journal)
+            self._base = Counter()
+        except Exception as e:
+            print(f"Warning: failed to clear history: {e}")
+
+
+class BackgroundWriter:
+    # Autosave off the interactive thread: records go to a queue and a writer
+    # thread appends them to the journal in batches, one batch once `batch`
+    # records are waiting or `interval` seconds after the first of them.
+    # interval=0 writes every record as soon as it arrives.
+    def __init__(self, manager, interval=1.0, batch=50):
+        self.manager = manager
+        self.interval = interval
+        self.batch = batch
+        self.lock = threading.Lock()  # held while the manager is in use
+        self.stats = {"submitted": 0, "records": 0, "writes": 0, "last_lag": 0.0,
+                      "max_lag": 0.0, "write_seconds": 0.0}
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        self.stats["submitted"] += 1
+        self._queue.put((time.monotonic(), record))
+
+    def _run(self):
+        # queue items: (time, record); an Event asks for an immediate write
+        # and is set once it is done; None stops the thread
+        stop = False
+        while not stop:
+            batch, done = [], None
+            item = self._queue.get()
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    done = item
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch:
+                    break
+                timeout = batch[0][0] + self.interval - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._write(batch)
+            if done is not None:
+                done.set()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        start = time.monotonic()
+        with self.lock:
+            for _, record in batch:
+                self.manager.append(record)
+            self.manager.flush()
+        end = time.monotonic()
+        lag = end - batch[0][0]
+        self.stats["records"] += len(batch)
+        self.stats["writes"] += 1
+        self.stats["last_lag"] = lag
+        self.stats["max_lag"] = max(self.stats["max_lag"], lag)
+        self.stats["write_seconds"] += end - start
+
+    def sync(self):
+        # Block until everything submitted so far is on disk
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def pending(self):
+        return self.stats["submitted"] - self.stats["records"]
+
+    def report(self):
+        return (f"Autosave: {self.stats['records']} records in {self.stats['writes']} writes "
+                f"({self.stats['write_seconds']:.3f}s on disk), {self.pending()} pending; "
+                f"write lag last {self.stats['last_lag']:.3f}s, max {self.stats['max_lag']:.3f}s")
+
+
+class HistoryReader:
+    # Reads a snapshot and its journal from the end, newest record first,
+    # without parsing the whole file.  Both files are memory-mapped, so only
+    # the pages holding the records actually read are touched.
+    def __init__(self, filename=HISTORY_FILE, journal=None):
+        self.filename = filename
+        self.journal = filename + ".log" if journal is None else journal
+
+    @staticmethod
+    def _map(path):
+        try:
+            with open(path, "rb") as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # missing or empty
+            return None
+
+    @staticmethod
+    def _reverse_lines(mm):
+        end = len(mm)
+        while end > 0:
+            nl = mm.rfind(b"\n", 0, end)
+            yield mm[nl + 1:end]
+            end = nl
+
+    @staticmethod
+    def _snapshot_record(line):
+        line = line.strip()
+        if line.endswith(b","):
+            line = line[:-1]
+        if line in (b"", b"[", b"]", b"[]"):
+            return None, False
+        return json.loads(line), True
+
+    @staticmethod
+    def _full_snapshot(mm):
+        try:
+            history = json.loads(mm[:])
+        except ValueError:
+            return []
+        return history if isinstance(history, list) else []
+
+    def _snapshot_newest(self):
+        mm = self._map(self.filename)
+        if mm is None:
+            return
+        with mm:
+            if mm[:2] != b"[\n":
+                yield from reversed(self._full_snapshot(mm))
+                return
+            done = 0
+            for line in self._reverse_lines(mm):
+                try:
+                    record, ok = self._snapshot_record(line)
+                except ValueError:
+                    # a record spanning several lines: fall back to a full parse
+                    history = self._full_snapshot(mm)
+                    yield from reversed(history[:max(0, len(history) - done)])
+                    return
+                if ok:
+                    done += 1
+                    yield record
+
+    def _journal_newest(self):
+        mm = self._map(self.journal)
+        if mm is None:
+            return
+        with mm:
+            for line in self._reverse_lines(mm):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    pass  # torn last line from a crash
+
+    def newest(self):
+        # Records are migrated to the structured form as they are read
+        yield from map(migrate_record, self._journal_newest())
+        yield from map(migrate_record, self._snapshot_newest())
+
+    def tail(self, n):
+        # The last n records, oldest first
+        records = list(islice(self.newest(), n))
+        records.reverse()
+        return records
+
+    def oldest(self):
+        return map(migrate_record, self._oldest())
+
+    def _oldest(self):
+        mm = self._map(self.filename)
+        if mm is not None:
+            with mm:
+                if mm[:2] != b"[\n":
+                    yield from self._full_snapshot(mm)
+                else:
+                    done = 0
+                    for line in iter(mm.readline, b""):
+                        try:
+                            record, ok = self._snapshot_record(line)
+                        except ValueError:
+                            yield from self._full_snapshot(mm)[done:]
+                            break
+                        if ok:
+                            done += 1
+                            yield record
+        mm = self._map(self.journal)
+        if mm is not None:
+            with mm:
+                for line in iter(mm.readline, b""):
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        pass
+
+    @staticmethod
+    def _count_lines(path):
+        count = 0
+        last = b"\n"
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                count += chunk.count(b"\n")
+                last = chunk[-1:]
+        return count, last
+
+    @staticmethod
+    def _one_per_line(mm):
+        # A record spanning several lines (json.dump with indent of dict
+        # records) opens a { or [ at the end of a line; one-line records never do
+        return mm[:2] == b"[\n" and mm.find(b"{\n", 1) < 0 and mm.find(b"[\n", 1) < 0
+
+    def count(self):
+        total = 0
+        mm = self._map(self.filename)
+        if mm is not None:
+            with mm:
+                if self._one_per_line(mm):
+                    lines, last = self._count_lines(self.filename)
+                    total += max(0, lines + (last != b"\n") - 2)
+                else:
+                    total += len(self._full_snapshot(mm))
+        if os.path.exists(self.journal):
+            total += self._count_lines(self.journal)[0]
+        return total
+
+
+# Records kept in memory by HistoryBuffer before older ones go to disk
+HISTORY_MEMORY_RECORDS = 1000
+
+
+class _Entry:
+    # A record without the per-record dict: operands as a tuple, and op,
+    # session and message strings interned so repeats share one object.
+    __slots__ = ("op", "operands", "result", "ts", "session", "text")
+
+    def __init__(self, op, operands, result, ts, session, text):
+        self.op = op
+        self.operands = operands
+        self.result = result
+        self.ts = ts
+        self.session = session
+        self.text = text
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+class HistoryBuffer:
+    # Drop-in for the history list (append, extend, clear, len, iteration
+    # both ways).  The newest `capacity` records stay in memory as _Entry
+    # objects (plain-text records as interned strs); older ones spill, one
+    # JSON line each, to an anonymous temp file, so a long session's memory
+    # stays flat.
+    def __init__(self, records=(), capacity=HISTORY_MEMORY_RECORDS):
+        self.capacity = max(1, capacity)
+        self._recent = deque()
+        self._spill = None
+        self._spilled = 0
+        self.extend(records)
+
+    @staticmethod
+    def _pack(record):
+        if isinstance(record, str):
+            return sys.intern(record)
+        return _Entry(_intern(record["op"]), tuple(record["operands"]), record["result"],
+                      record["ts"], _intern(record["session"]), _intern(record.get("text")))
+
+    @staticmethod
+    def _unpack(entry):
+        if isinstance(entry, str):
+            return entry
+        record = {"op": entry.op, "operands": list(entry.operands), "result": entry.result,
+                  "ts": entry.ts, "session": entry.session}
+        if entry.text is not None:
+            record["text"] = entry.text
+        return record
+
+    def append(self, record):
+        self._recent.append(self._pack(record))
+        if len(self._recent) > self.capacity:
+            if self._spill is None:
+                import tempfile
+                self._spill = tempfile.TemporaryFile()
+            self._spill.write(json.dumps(self._unpack(self._recent.popleft())).encode() + b"\n")
+            self._spilled += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def clear(self):
+        self._recent.clear()
+        if self._spill is not None:
+            self._spill.seek(0)
+            self._spill.truncate()
+        self._spilled = 0
+
+    def __len__(self):
+        return self._spilled + len(self._recent)
+
+    def _map_spill(self):
+        if not self._spilled:
+            return None
+        self._spill.flush()
+        return mmap.mmap(self._spill.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        mm = self._map_spill()
+        if mm is not None:
+            with mm:
+                for line in iter(mm.readline, b""):
+                    yield json.loads(line)
+        for entry in list(self._recent):
+            yield self._unpack(entry)
+
+    def __reversed__(self):
+        for entry in reversed(list(self._recent)):
+            yield self._unpack(entry)
+        mm = self._map_spill()
+        if mm is not None:
+            with mm:
+                for line in HistoryReader._reverse_lines(mm):
+                    if line:
+                        yield json.loads(line)
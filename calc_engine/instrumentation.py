@@ -0,0 +1,172 @@
+import bisect
+import contextlib
+import json
+import sys
+import time
+
+from . import expression, render
+from .calculator import Calculator
+from .history import HistoryManager, HistoryReader, JournalHistoryManager
+
+# Instrumentation: call counts, total time and latency histograms per
+# operation. Nothing is wrapped until enable() is called, so there is no
+# cost while it is off.
+class Instrumentation:
+    # histogram bucket upper bounds in seconds: 1us, 2us, 4us ... ~34s
+    BUCKETS = [2**i / 1e6 for i in range(26)]
+    FUNCTIONS = {
+        (expression, "safe_eval"): "safe_eval",
+        (expression, "compile_expression"): "parse",
+        (expression, "execute"): "eval",
+        (render, "render_number"): "format",
+    }
+    CLASSES = {
+        Calculator: ["add", "subtract", "multiply", "divide", "modulus", "exponent",
+                     "check_even_odd", "percentage_of", "factorial", "base_convert"],
+        HistoryManager: ["load_history", "save_history", "clear_history"],
+        JournalHistoryManager: ["load_history", "append", "flush", "compact"],
+        HistoryReader: ["tail", "count"],
+    }
+
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self._profile_next = {}
+        self._originals = []
+
+    def record(self, name, seconds):
+        entry = self.stats.get(name)
+        if entry is None:
+            entry = self.stats[name] = [0, 0.0, [0] * (len(self.BUCKETS) + 1)]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+
+    def profile_next(self, name, hook):
+        # hook() returns a context manager wrapped around the next `name` call,
+        # e.g. cprofile_hook() or a sampling profiler's start/stop
+        self._profile_next[name] = hook
+
+    def _wrap(self, name, func):
+        clock = time.perf_counter
+        record = self.record
+        profile_next = self._profile_next
+
+        def wrapper(*args, **kwargs):
+            hook = profile_next.pop(name, None) if profile_next else None
+            start = clock()
+            try:
+                if hook is not None:
+                    with hook():
+                        return func(*args, **kwargs)
+                return func(*args, **kwargs)
+            finally:
+                record(name, clock() - start)
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def enable(self):
+        if self.enabled:
+            return
+        for (home, func_name), label in self.FUNCTIONS.items():
+            original = getattr(home, func_name)
+            wrapper = self._wrap(label, original)
+            # rebind every module that imported the function by name
+            for module in list(sys.modules.values()):
+                namespace = getattr(module, "__dict__", None)
+                if isinstance(namespace, dict) and namespace.get(func_name) is original:
+                    self._originals.append((namespace, func_name, original))
+                    namespace[func_name] = wrapper
+        for cls, methods in self.CLASSES.items():
+            for method in methods:
+                if method in cls.__dict__:
+                    original = cls.__dict__[method]
+                    self._originals.append((cls, method, original))
+                    setattr(cls, method, self._wrap(f"{cls.__name__}.{method}", original))
+        self.enabled = True
+
+    def disable(self):
+        for target, name, original in reversed(self._originals):
+            if isinstance(target, dict):
+                target[name] = original
+            else:
+                setattr(target, name, original)
+        self._originals.clear()
+        self.enabled = False
+
+    def percentile(self, name, q):
+        count, _, buckets = self.stats[name]
+        seen = 0
+        for i, n in enumerate(buckets):
+            seen += n
+            if seen >= q * count:
+                return self.BUCKETS[i] if i < len(self.BUCKETS) else float("inf")
+        return float("inf")
+
+    def summary(self):
+        rows = []
+        for name, (count, total, _) in sorted(self.stats.items(), key=lambda item: -item[1][1]):
+            rows.append({
+                "name": name, "count": count, "total_seconds": total,
+                "mean_seconds": total / count,
+                "p50_seconds": self.percentile(name, 0.5),
+                "p99_seconds": self.percentile(name, 0.99),
+            })
+        return rows
+
+    def dump(self, path):
+        try:
+            with open(path, "w") as f:
+                if path.endswith((".prom", ".txt")):
+                    f.write(self.prometheus())
+                else:
+                    json.dump({"operations": self.summary(),
+                               "buckets": self.BUCKETS,
+                               "histograms": {name: entry[2] for name, entry in self.stats.items()}},
+                              f, indent=4)
+        except Exception as e:
+            print(f"Warning: failed to write stats: {e}")
+
+    def prometheus(self):
+        lines = ["# TYPE calc_operation_seconds histogram"]
+        for name, (count, total, buckets) in sorted(self.stats.items()):
+            seen = 0
+            for bound, n in zip(self.BUCKETS, buckets):
+                seen += n
+                lines.append(f'calc_operation_seconds_bucket{{op="{name}",le="{bound:g}"}} {seen}')
+            lines.append(f'calc_operation_seconds_bucket{{op="{name}",le="+Inf"}} {count}')
+            lines.append(f'calc_operation_seconds_sum{{op="{name}"}} {total}')
+            lines.append(f'calc_operation_seconds_count{{op="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def print_stats(self):
+        if not self.stats:
+            print("No operations recorded yet.")
+            return
+        print(f"\n{'operation':32s} {'calls':>8s} {'total ms':>10s} {'mean us':>10s} {'p99 us':>10s}")
+        for row in self.summary():
+            print(f"{row['name']:32s} {row['count']:8d} {row['total_seconds'] * 1e3:10.2f} "
+                  f"{row['mean_seconds'] * 1e6:10.1f} {row['p99_seconds'] * 1e6:10.0f}")
+
+
+instrumentation = Instrumentation()
+
+
+@contextlib.contextmanager
+def _cprofile(path=None, limit=15):
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        else:
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(limit)
+
+
+def cprofile_hook(path=None):
+    return lambda: _cprofile(path)
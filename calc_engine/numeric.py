@@ -0,0 +1,250 @@
+import ast
+import decimal
+import math
+import operator as op
+from functools import lru_cache
+
+from .bases import from_base
+from .expression import FUNCTIONS, cost_model
+from .render import render_number
+
+# Numeric modes: "float" is the native float/int arithmetic the calculator
+# has always used, "decimal" evaluates through decimal.Decimal at a set
+# precision and "fraction" through fractions.Fraction, exactly.  A mode is
+# resolved once into the functions that the compiler and Calculator bind
+# into their code, so no operation looks at the mode again.
+MODES = ("float", "decimal", "fraction")
+DEFAULT_PRECISION = 28
+
+# Functions that map whole numbers to whole numbers; only these keep an
+# exact-mode expression on the native int fast path
+WHOLE_FUNCTIONS = frozenset({"abs", "floor", "ceil", "trunc", "round",
+                             "isqrt", "gcd", "lcm", "factorial", "comb", "perm"})
+_INTEGER_ARGS = ("isqrt", "gcd", "lcm", "factorial", "comb", "perm")
+_TO_INT = ("floor", "ceil", "trunc")
+_NATIVE = {
+    ast.Add: op.add, ast.Sub: op.sub, ast.Mult: op.mul, ast.Div: op.truediv,
+    ast.FloorDiv: op.floordiv, ast.Mod: op.mod, ast.Pow: op.pow,
+}
+
+
+def _whole_first(parse):
+    # whole numbers read as ints, which exact modes can keep native
+    def read(text):
+        try:
+            return int(text)
+        except ValueError:
+            return parse(text)
+    return read
+
+
+class NumericMode:
+    def __init__(self, name="float", precision=DEFAULT_PRECISION):
+        if name not in MODES:
+            raise ValueError(f"unknown numeric mode '{name}' (choose from {', '.join(MODES)})")
+        if precision < 1:
+            raise ValueError("precision must be at least 1")
+        self.name = name
+        self.precision = precision
+        self.exact = name != "float"
+        self.key = f"decimal{precision}" if name == "decimal" else name
+        self.ops = {}        # ast operator class -> function on the mode's numbers
+        self.functions = {}  # expression function name -> function
+        if name == "decimal":
+            self._decimal_mode()
+        elif name == "fraction":
+            self._fraction_mode()
+        else:
+            self.type = float
+            self.parse = float
+            self.convert = lambda x: x
+
+    def binary(self, kind):
+        # kind's arithmetic for Calculator.  Float mode is the plain
+        # operator; exact modes convert the operands, except that int op int
+        # stays native wherever that is already exact (not / or b < 0 powers)
+        native = _NATIVE[kind]
+        if not self.exact:
+            return native
+        exact, convert, error = self.ops[kind], self.convert, self.error
+        whole = kind is not ast.Div
+        power = kind is ast.Pow
+
+        def apply(a, b):
+            if whole and type(a) is int and type(b) is int and not (power and b < 0):
+                return native(a, b)
+            try:
+                return exact(convert(a), convert(b))
+            except ArithmeticError as e:
+                raise error(e) from None
+        return apply
+
+    def error(self, e):
+        # decimal's signals as the exceptions float arithmetic would raise;
+        # a zero divisor reads the same in every mode, not "Fraction(1, 0)"
+        if isinstance(e, ZeroDivisionError):
+            return ZeroDivisionError("division by zero")
+        if not isinstance(e, decimal.DecimalException):
+            return e
+        if isinstance(e, decimal.Overflow):
+            return OverflowError(f"result too large for {self.name} mode")
+        return ValueError("math domain error")
+
+    def __repr__(self):
+        return f"NumericMode({self.name!r}, {self.precision})" if self.name == "decimal" else f"NumericMode({self.name!r})"
+
+    def _decimal_mode(self):
+        ctx = self.context = decimal.Context(prec=self.precision)
+        Decimal = self.type = decimal.Decimal
+
+        def parse(text):
+            try:
+                return Decimal(text.strip())
+            except decimal.InvalidOperation:
+                raise ValueError(f"could not convert string to a number: {text!r}")
+
+        def convert(x):
+            if type(x) is Decimal:
+                return x
+            if isinstance(x, int):
+                return Decimal(x)
+            if isinstance(x, float):
+                return Decimal(repr(x))  # the shortest text that reads back as x
+            if hasattr(x, "denominator"):
+                return ctx.divide(Decimal(x.numerator), x.denominator)
+            raise TypeError(f"can't use {type(x).__name__} as a number")
+
+        def floordiv(a, b):
+            # Decimal // truncates; Python's operators floor
+            q, r = ctx.divmod(a, b)
+            return ctx.subtract(q, 1) if r and (r < 0) != (b < 0) else q
+
+        def mod(a, b):
+            r = ctx.remainder(a, b)
+            return ctx.add(r, b) if r and (r < 0) != (b < 0) else r
+
+        def power(a, b):
+            # Decimal gives Infinity for 0 ** -n; float and Fraction refuse
+            if not a and b < 0:
+                raise ZeroDivisionError("division by zero")
+            return ctx.power(a, b)
+
+        def rounding(x, digits=None):
+            if digits is None:
+                return ctx.to_integral_value(x)
+            return ctx.quantize(x, Decimal(1).scaleb(-int(digits)))
+
+        wide = decimal.Context(prec=self.precision + 5)
+
+        def log(x, base=None):
+            # a ratio of logs, worked with guard digits so log(8, 2) is 3
+            if base is None:
+                return ctx.ln(x)
+            result = ctx.plus(wide.divide(wide.ln(x), wide.ln(base)))
+            return ctx.quantize(result, 1) if result == result.to_integral_value() else result
+
+        self.parse = _whole_first(parse)
+        self.convert = convert
+        self.ops = {
+            ast.Add: ctx.add, ast.Sub: ctx.subtract, ast.Mult: ctx.multiply,
+            ast.Div: ctx.divide, ast.FloorDiv: floordiv, ast.Mod: mod,
+            ast.Pow: power, ast.UAdd: ctx.plus, ast.USub: ctx.minus,
+        }
+        self._exact_functions({
+            "sqrt": ctx.sqrt, "exp": ctx.exp, "log": log, "log10": ctx.log10,
+            "log2": lambda x: log(x, 2),
+            "abs": ctx.abs, "fabs": ctx.abs, "round": rounding,
+        })
+
+    def _fraction_mode(self):
+        from fractions import Fraction  # only loaded for this mode
+        self.type = Fraction
+
+        def parse(text):
+            # digits go through from_base, which has no 4300-digit limit, so
+            # long exact text from the history reads back
+            text = text.strip()
+            numerator, slash, denominator = text.partition("/")
+            if numerator.lstrip("+-").isdigit() and (not slash or denominator.isdigit()):
+                return Fraction(from_base(numerator, 10), from_base(denominator, 10) if slash else 1)
+            return Fraction(text)
+
+        def convert(x):
+            if type(x) is Fraction:
+                return x
+            if isinstance(x, float):
+                return Fraction(repr(x))
+            if isinstance(x, complex):
+                raise ValueError("result is not a real number")
+            return Fraction(x)
+
+        def multiply(a, b):
+            if not cost_model.allows(cost_model.mul_bits(a, b)):
+                raise ValueError(f"{render_number(a)} * {render_number(b)} = too large")
+            return a * b
+
+        def power(a, b):
+            # whole powers stay exact; roots come back as floats
+            if not cost_model.allows(cost_model.pow_bits(a, b)):
+                raise ValueError(f"{render_number(a)} ** {render_number(b)} = too large")
+            return convert(a ** b)
+
+        def sqrt(x):
+            if x >= 0:
+                n, d = math.isqrt(x.numerator), math.isqrt(x.denominator)
+                if n * n == x.numerator and d * d == x.denominator:
+                    return Fraction(n, d)
+            return convert(math.sqrt(x))
+
+        self.parse = _whole_first(parse)
+        self.convert = convert
+        self.ops = {
+            ast.Add: op.add, ast.Sub: op.sub, ast.Mult: multiply,
+            ast.Div: op.truediv, ast.FloorDiv: lambda a, b: Fraction(a // b), ast.Mod: op.mod,
+            ast.Pow: power, ast.UAdd: op.pos, ast.USub: op.neg,
+        }
+        self._exact_functions({
+            "sqrt": sqrt, "abs": abs, "fabs": abs,
+            "round": lambda x, digits=None: convert(round(x) if digits is None else round(x, int(digits))),
+        })
+
+    def _exact_functions(self, native):
+        # Every expression function, on the mode's numbers: `native` ones
+        # as given, whole-number ones through int, the rest through float
+        # (rounded to double precision, then converted back)
+        convert = self.convert
+
+        def whole(name, x):
+            n = int(x)
+            if n != x:
+                raise ValueError(f"{name}() needs whole numbers, not {render_number(x)}")
+            return n
+
+        def integer_args(name, func):
+            return lambda *args: convert(func(*(whole(name, x) for x in args)))
+
+        def via_float(func):
+            return lambda *args: convert(func(*map(float, args)))
+
+        for name, (func, _, _, _) in FUNCTIONS.items():
+            if name in native:
+                self.functions[name] = native[name]
+            elif name in _INTEGER_ARGS:
+                self.functions[name] = integer_args(name, func)
+            elif name in _TO_INT:
+                self.functions[name] = lambda x, func=func: convert(func(x))
+            else:
+                self.functions[name] = via_float(func)
+
+
+@lru_cache(maxsize=None)
+def _mode(name, precision):
+    return NumericMode(name, precision)
+
+
+def numeric_mode(mode=None, precision=DEFAULT_PRECISION):
+    # A NumericMode from a name (None for float); modes are shared, so
+    # compiled expressions can be cached per mode
+    if isinstance(mode, NumericMode):
+        return mode
+    return _mode(mode or "float", precision if mode == "decimal" else DEFAULT_PRECISION)
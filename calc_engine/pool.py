@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from .batch import batch_line
+from .calculator import Calculator
+from .expression import safe_eval
+from .numeric import DEFAULT_PRECISION
+from .render import render_number
+
+
+# Worker pool: Calculator and safe_eval jobs run in separate processes so a
+# job that overruns its deadline can be killed without touching the caller.
+def _run_job(job, calc=None):
+    kind, payload, last = job
+    calc = calc or Calculator()
+    calc.last_result = last
+    if kind == "call":
+        name, args = payload
+        result, message = getattr(calc, name)(*args)
+    elif kind == "eval":
+        result = safe_eval(payload, last_result=last, mode=calc.numbers)
+        message = f"Expression = {render_number(result)}"
+        calc.last_result = result
+    elif kind == "line":
+        result, message = batch_line(calc, payload)
+    else:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return result, message, calc.last_result
+
+
+def _pool_worker(conn, mode=None, precision=DEFAULT_PRECISION):
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        try:
+            conn.send(("ok", _run_job(job, Calculator(mode=mode, precision=precision))))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class JobPool:
+    def __init__(self, workers=None, timeout=10.0, mode=None, precision=DEFAULT_PRECISION):
+        # workers calculate in the given numeric mode, like Calculator
+        self.size = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.mode = (mode, precision)
+        self._idle = queue.Queue()
+        self._threads = ThreadPoolExecutor(max_workers=self.size)
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        conn, child_conn = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=_pool_worker, args=(child_conn, *self.mode), daemon=True)
+        proc.start()
+        child_conn.close()
+        return proc, conn
+
+    def _replace(self, proc, conn):
+        proc.kill()
+        proc.join()
+        conn.close()
+        return self._spawn()
+
+    def call(self, job, timeout=None):
+        # Returns (result, message, last_result); raises TimeoutError or ValueError
+        timeout = self.timeout if timeout is None else timeout
+        proc, conn = self._idle.get()
+        status = None
+        try:
+            conn.send(job)
+            if conn.poll(timeout):
+                status, value = conn.recv()
+        except (EOFError, OSError):
+            status = "died"
+        finally:
+            if status not in ("ok", "error"):
+                proc, conn = self._replace(proc, conn)
+            self._idle.put((proc, conn))
+        if status is None:
+            raise TimeoutError(f"Timed out after {timeout}s")
+        if status == "died":
+            raise ValueError("Worker process died")
+        if status == "error":
+            raise ValueError(value)
+        return value
+
+    def map(self, jobs, timeout=None):
+        # Results come back in job order; a failed job yields its exception
+        def attempt(job):
+            try:
+                return self.call(job, timeout)
+            except (TimeoutError, ValueError) as e:
+                return e
+        return list(self._threads.map(attempt, jobs))
+
+    def close(self):
+        self._threads.shutdown()
+        while not self._idle.empty():
+            proc, conn = self._idle.get()
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            proc.join(timeout=1)
+            if proc.is_alive():
+                proc.kill()
+            conn.close()
@@ -0,0 +1,79 @@
+import decimal
+import math
+
+# Rendering: huge ints keep their exact value but are shown as a summary
+# (leading digits, trailing digits and digit count) unless the full decimal
+# form is asked for explicitly.  Fractions render their numerator and
+# denominator the same way.
+FULL_RENDER_DIGITS = 1000
+_LOG10_2 = math.log10(2)
+
+
+def digit_count(n):
+    n = abs(n)
+    if n < 10:
+        return 1
+    d = int((n.bit_length() - 1) * _LOG10_2)
+    p = 10**d
+    if n >= p * 10:
+        return d + 2
+    return d + 1 if n >= p else d
+
+
+def leading_digits(n, k=20):
+    # Top bits of n scaled by the dropped power of two, with guard digits
+    n = abs(n)
+    shift = max(0, n.bit_length() - 4 * (k + 20))
+    ctx = decimal.Context(prec=k + 20, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+    value = ctx.multiply(decimal.Decimal(n >> shift), ctx.power(decimal.Decimal(2), shift))
+    digits = "".join(map(str, value.as_tuple().digits))
+    guard = digits[k:k + 15]
+    if len(guard) == 15 and guard.strip("9") and guard.strip("0"):
+        return digits[:k]
+    # Too close to a digit boundary to trust the estimate (e.g. 10**d - 1)
+    return str(n // 10**max(0, digit_count(n) - k))[:k]
+
+
+def render_number(x, max_digits=FULL_RENDER_DIGITS, lead=20, tail=10):
+    if not isinstance(x, int) and hasattr(x, "denominator"):
+        numerator = render_number(x.numerator, max_digits, lead, tail)
+        if x.denominator == 1:
+            return numerator
+        return f"{numerator}/{render_number(x.denominator, max_digits, lead, tail)}"
+    if not isinstance(x, int) or x.bit_length() <= max_digits * 3:
+        return str(x)
+    digits = digit_count(x)
+    if digits <= max_digits:
+        return str(x)
+    sign = "-" if x < 0 else ""
+    head = leading_digits(x, lead)
+    end = str(abs(x) % 10**tail).zfill(tail)
+    return f"{sign}{head[0]}.{head[1:]}e+{digits - 1} ({digits} digits, ends ...{end})"
+
+
+_DEC_CONTEXT = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+_DEC_POW2 = {}
+
+
+def _int_to_decimal(n, bits):
+    # Split on a power of two and join with Decimal arithmetic, whose big
+    # multiplication is subquadratic, unlike int -> str
+    if bits <= 3000:
+        return decimal.Decimal(n)
+    half = bits >> 1
+    pow2 = _DEC_POW2.get(half)
+    if pow2 is None:
+        pow2 = _DEC_POW2[half] = _DEC_CONTEXT.power(decimal.Decimal(2), half)
+    high = _int_to_decimal(n >> half, bits - half)
+    low = _int_to_decimal(n & ((1 << half) - 1), half)
+    return _DEC_CONTEXT.add(_DEC_CONTEXT.multiply(high, pow2), low)
+
+
+def full_decimal(n):
+    if not isinstance(n, int):
+        return str(n)
+    if n.bit_length() <= 12000:
+        return str(n)
+    sign = "-" if n < 0 else ""
+    n = abs(n)
+    return sign + str(_int_to_decimal(n, n.bit_length()))
@@ -0,0 +1,180 @@
+import os
+import struct
+import time
+import zlib
+
+from .render import digit_count
+
+
+def value_key(x):
+    # Small numbers key by repr; big ones by a digest of their bytes, and
+    # Fractions by their two parts
+    if not isinstance(x, int) and hasattr(x, "denominator"):
+        return f"{value_key(x.numerator)}/{value_key(x.denominator)}"
+    if isinstance(x, int) and x.bit_length() > 256:
+        import hashlib  # kept off the import path until a big key shows up
+        raw = x.to_bytes((x.bit_length() + 8) // 8, "little", signed=True)
+        return "#" + hashlib.blake2b(raw, digest_size=16).hexdigest()
+    return repr(x)
+
+
+def eval_key(compiled, ans=None, env=None):
+    bound = [f"{name}={value_key(ans if name == 'ans' else env[name])}" for name in compiled.names]
+    mode = "" if compiled.mode is None else compiled.mode.key + ":"
+    return "eval:" + mode + compiled.text + ("|" + ";".join(bound) if bound else "")
+
+
+def call_key(name, args):
+    return f"call:{name}(" + ",".join(map(value_key, args)) + ")"
+
+
+def encode_result(result, message=None):
+    # <message length><message><tag><payload>; ints as two's complement bytes
+    text = (message or "").encode()
+    if isinstance(result, bool):
+        return None
+    if isinstance(result, int):
+        body = b"i" + result.to_bytes((result.bit_length() + 8) // 8, "little", signed=True)
+    elif isinstance(result, float):
+        body = b"f" + struct.pack("<d", result)
+    elif isinstance(result, complex):
+        body = b"c" + struct.pack("<dd", result.real, result.imag)
+    else:
+        return None
+    return struct.pack("<I", len(text)) + text + body
+
+
+def decode_result(blob):
+    (size,) = struct.unpack_from("<I", blob)
+    message = blob[4:4 + size].decode() or None
+    tag, payload = blob[4 + size:5 + size], blob[5 + size:]
+    if tag == b"i":
+        return int.from_bytes(payload, "little", signed=True), message
+    if tag == b"f":
+        return struct.unpack("<d", payload)[0], message
+    if tag == b"c":
+        return complex(*struct.unpack("<dd", payload)), message
+    raise ValueError(f"unknown result tag {tag!r}")
+
+
+class ResultCache:
+    # Results of expensive evaluations, kept in SQLite between sessions.
+    # Rows carry a CRC32 of the encoded value (a mismatch is dropped and
+    # counted as corrupt) and a last-used time; the least recently used rows
+    # go once the stored values pass max_bytes.
+    MIN_SECONDS = 0.001  # faster results aren't worth a disk write
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "corrupt": 0,
+                      "bytes_served": 0, "bytes_saved": 0, "seconds_saved": 0.0}
+        self._db = None
+        self._pid = None
+        self._inherited = []
+        import threading
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import sqlite3
+        if self._pid != os.getpid():
+            if self._db is not None:
+                # opened before a fork: never use or close the parent's handle
+                self._inherited.append(self._db)
+            self._db = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                       check_same_thread=False)
+            self._db.text_factory = bytes  # a damaged value may read back as text
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")  # a lost entry is only a miss
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, "
+                             "value BLOB NOT NULL, checksum INTEGER NOT NULL, "
+                             "seconds REAL NOT NULL, used REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            self._pid = os.getpid()
+        return self._db
+
+    def get(self, key):
+        # -> (result, message) or None
+        import sqlite3  # loaded only once a cache is in use
+        with self._lock:
+            try:
+                db = self._connect()
+                row = db.execute("SELECT value, checksum, seconds FROM results WHERE key = ?",
+                                 (key,)).fetchone()
+                if row is None:
+                    self.stats["misses"] += 1
+                    return None
+                blob, checksum, seconds = row
+                try:
+                    if zlib.crc32(blob) != checksum:
+                        raise ValueError("checksum mismatch")
+                    value = decode_result(blob)
+                except (ValueError, TypeError, struct.error, UnicodeDecodeError):
+                    db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self.stats["corrupt"] += 1
+                    self.stats["misses"] += 1
+                    return None
+                db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error as e:
+                print(f"Warning: result cache unavailable: {e}")
+                return None
+            self.stats["hits"] += 1
+            self.stats["bytes_served"] += len(blob)
+            self.stats["seconds_saved"] += seconds
+            return value
+
+    def put(self, key, result, message=None, seconds=0.0):
+        if result is None or seconds < self.MIN_SECONDS:
+            return
+        import sqlite3
+        blob = encode_result(result, message)
+        if blob is None or len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                db = self._connect()
+                db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                           (key, blob, zlib.crc32(blob), seconds, time.time()))
+                self.stats["stores"] += 1
+                if isinstance(result, int):
+                    # against storing the decimal text
+                    self.stats["bytes_saved"] += max(0, digit_count(result) - (len(blob) - 4 - len(message or "")))
+                self._evict(db)
+            except sqlite3.Error as e:
+                print(f"Warning: result cache unavailable: {e}")
+
+    def _evict(self, db):
+        (total,) = db.execute("SELECT total(length(value)) FROM results").fetchone()
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for rowid, size in db.execute("SELECT rowid, length(value) FROM results ORDER BY used"):
+            if total <= self.max_bytes:
+                break
+            victims.append((rowid,))
+            total -= size
+        db.executemany("DELETE FROM results WHERE rowid = ?", victims)
+        self.stats["evictions"] += len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM results")
+
+    def report(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / lookups if lookups else 0.0
+        return [
+            f"Result cache: {self.stats['hits']}/{lookups} hits ({rate:.0%}), "
+            f"{self.stats['stores']} stored, {self.stats['evictions']} evicted, {self.stats['corrupt']} corrupt",
+            f"  saved {self.stats['seconds_saved']:.3f}s of computation, served {self.stats['bytes_served']} bytes; "
+            f"compact encoding saved {self.stats['bytes_saved']} bytes over decimal text",
+        ]
+
+
+result_cache = None  # ResultCache, opened with --result-cache
+
+
+def set_result_cache(cache):
+    # Install (or with None, remove) the cache consulted by safe_eval and Calculator
+    global result_cache
+    result_cache = cache
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import math
+import time
+
+from .batch import BATCH_OPS
+from .calculator import Calculator
+from .expression import compile_expression
+from .history import HISTORY_FILE, SESSION_ID, JournalHistoryManager, parse_message
+from .pool import _run_job
+from .render import render_number
+from .variables import parse_assignment
+
+
+# Service mode: one asyncio process serves many sessions over TCP or a Unix
+# socket. Each line is a JSON request or a plain batch line, answered with
+# one JSON line. Every connection has its own Calculator (and so its own ans).
+# op -> the accepted types of each argument (bools are rejected too)
+_NUMBER = (int, float)
+SERVICE_METHODS = {
+    "add": (_NUMBER, _NUMBER), "subtract": (_NUMBER, _NUMBER),
+    "multiply": (_NUMBER, _NUMBER), "divide": (_NUMBER, _NUMBER),
+    "modulus": (_NUMBER, _NUMBER), "exponent": (_NUMBER, _NUMBER),
+    "check_even_odd": (_NUMBER, _NUMBER), "percentage_of": (_NUMBER, _NUMBER),
+    "factorial": (_NUMBER,), "base_convert": (_NUMBER, _NUMBER),
+    "parse_base": ((str, int), _NUMBER),  # digits may be text, e.g. "ff"
+}
+HEAVY_METHODS = {"exponent", "factorial", "base_convert", "parse_base"}
+
+
+def _json_value(x):
+    if isinstance(x, int) and x.bit_length() > 64:
+        return render_number(x)
+    if isinstance(x, float) and not math.isfinite(x):
+        return str(x)
+    return x
+
+
+def _heavy(calc, exprs, heavy=False):
+    # Decided from the compiled programs: a power, an expensive call or a long
+    # program (what the result cache keeps) is worth a worker. Programs that
+    # read session variables stay here, the workers don't have them.
+    for expr in exprs:
+        try:
+            compiled = compile_expression(expr, calc.numbers)
+        except ValueError:
+            continue  # the job reports the error itself
+        if compiled.free_names:
+            return False
+        heavy = heavy or compiled.cacheable
+    return heavy
+
+
+def _service_job(calc, text):
+    # -> (job, heavy) for one request line
+    if text.startswith("{"):
+        request = json.loads(text)
+        name = request.get("op", "eval")
+        if name == "eval":
+            expr = str(request.get("expr", ""))
+            return ("eval", expr, calc.last_result), _heavy(calc, [expr])
+        if name not in SERVICE_METHODS:
+            raise ValueError(f"Unknown op '{name}'")
+        args = request.get("args", ())
+        kinds = SERVICE_METHODS[name]
+        if (not isinstance(args, list) or len(args) != len(kinds)
+                or not all(isinstance(x, k) and not isinstance(x, bool) for x, k in zip(args, kinds))):
+            raise ValueError(f"'{name}' takes {len(kinds)} number argument(s)")
+        args = tuple(args)
+        return ("call", (name, args), calc.last_result), name in HEAVY_METHODS
+    parts = text.split()
+    name = BATCH_OPS.get(parts[0].lower())
+    if parse_assignment(text) is not None:
+        heavy = False
+    elif name == "parse_base":
+        heavy = True
+    elif name is not None:
+        heavy = _heavy(calc, parts[1:], name in HEAVY_METHODS)
+    else:
+        heavy = _heavy(calc, [text])
+    return ("line", text, calc.last_result), heavy
+
+
+async def _serve_request(calc, text, pool, history_queue):
+    try:
+        job, heavy = _service_job(calc, text)
+        if heavy and pool is not None:
+            loop = asyncio.get_running_loop()
+            result, message, last = await loop.run_in_executor(None, pool.call, job)
+        else:
+            result, message, last = _run_job(job, calc)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    calc.last_result = last
+    history_queue.put_nowait(parse_message(message, time.time(), SESSION_ID))
+    return {"ok": True, "result": _json_value(result), "message": message}
+
+
+async def _handle_client(reader, writer, pool, history_queue):
+    calc = Calculator()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            text = line.decode(errors="replace").strip()
+            if not text:
+                continue
+            reply = await _serve_request(calc, text, pool, history_queue)
+            writer.write((json.dumps(reply) + "\n").encode())
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _history_writer(history_queue, history_manager, batch=256):
+    # One writer for all sessions: drain whatever is queued, then flush once
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await history_queue.get()
+        history_manager.append(message)
+        for _ in range(batch - 1):
+            if history_queue.empty():
+                break
+            history_manager.append(history_queue.get_nowait())
+        await loop.run_in_executor(None, history_manager.flush)
+
+
+async def serve(host="127.0.0.1", port=8765, unix_path=None, pool=None, history_file=HISTORY_FILE):
+    history_manager = JournalHistoryManager(history_file, flush_every=10**9)
+    history_queue = asyncio.Queue()
+    writer_task = asyncio.create_task(_history_writer(history_queue, history_manager))
+
+    async def handler(reader, writer):
+        await _handle_client(reader, writer, pool, history_queue)
+
+    if unix_path:
+        server = await asyncio.start_unix_server(handler, path=unix_path)
+        print(f"Serving on {unix_path}")
+    else:
+        server = await asyncio.start_server(handler, host, port)
+        print(f"Serving on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        writer_task.cancel()
+        while not history_queue.empty():
+            history_manager.append(history_queue.get_nowait())
+        history_manager.close()
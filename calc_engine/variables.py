@@ -0,0 +1,123 @@
+import re
+
+from .expression import compile_expression
+from .render import render_number
+
+# Named variables: each cell holds a compiled formula. Assigning a cell only
+# recomputes the cells downstream of it, in dependency order.
+_ASSIGNMENT_RE = re.compile(r"^\s*([A-Za-z_]\w*)\s*=(?!=)\s*(.+)$")
+
+
+def parse_assignment(text):
+    match = _ASSIGNMENT_RE.match(text)
+    if not match:
+        return None
+    return match.group(1), match.group(2)
+
+
+class Cell:
+    __slots__ = ("expr", "compiled", "deps", "error")
+
+    def __init__(self, expr, compiled, deps):
+        self.expr = expr
+        self.compiled = compiled
+        self.deps = deps
+        self.error = None
+
+
+class VariableGraph:
+    def __init__(self, mode=None):
+        self.mode = mode  # formulas compile for this NumericMode (None: float)
+        self.cells = {}
+        self.values = {}      # name -> value, for cells that evaluated cleanly
+        self.dependents = {}  # name -> set of cell names whose formula reads it
+
+    def __len__(self):
+        return len(self.cells)
+
+    def assign(self, name, expr, ans=None):
+        # Returns the names that were recomputed, starting with `name`
+        if name == "ans":
+            raise ValueError("'ans' is reserved for the last result")
+        compiled = compile_expression(expr, self.mode)
+        deps = compiled.free_names
+        cycle = self._find_cycle(name, deps)
+        if cycle is not None:
+            if len(cycle) > 8:
+                cycle = cycle[:4] + ["..."] + cycle[-3:]
+            raise ValueError("Circular reference: " + " -> ".join(cycle))
+
+        old = self.cells.get(name)
+        if old is not None:
+            for dep in old.deps:
+                self.dependents[dep].discard(name)
+        for dep in deps:
+            self.dependents.setdefault(dep, set()).add(name)
+        self.cells[name] = Cell(expr, compiled, deps)
+        return self._recompute(name, ans)
+
+    def _find_cycle(self, name, deps):
+        # A new formula closes a cycle if one of its deps reads `name`,
+        # directly or indirectly; search downstream from `name`
+        targets = set(deps)
+        parents = {name: None}
+        todo = [name]
+        while todo:
+            current = todo.pop()
+            if current in targets:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = parents[current]
+                return path[::-1] + [name]
+            for child in self.dependents.get(current, ()):
+                if child not in parents:
+                    parents[child] = current
+                    todo.append(child)
+        return None
+
+    def _recompute(self, start, ans=None):
+        dirty = {start}
+        todo = [start]
+        while todo:
+            for child in self.dependents.get(todo.pop(), ()):
+                if child not in dirty:
+                    dirty.add(child)
+                    todo.append(child)
+
+        # Kahn's algorithm over the dirty cells only
+        waiting = {name: sum(1 for dep in self.cells[name].deps if dep in dirty) for name in dirty}
+        ready = [name for name, count in waiting.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            self._evaluate(name, ans)
+            for child in self.dependents.get(name, ()):
+                if child in waiting:
+                    waiting[child] -= 1
+                    if waiting[child] == 0:
+                        ready.append(child)
+        return order
+
+    def _evaluate(self, name, ans):
+        cell = self.cells[name]
+        self.values.pop(name, None)
+        for dep in cell.deps:
+            if dep not in self.values:
+                cell.error = f"'{dep}' is undefined" if dep not in self.cells else f"'{dep}' has an error"
+                return
+        try:
+            self.values[name] = cell.compiled(ans, self.values)
+            cell.error = None
+        except Exception as e:
+            cell.error = str(e)
+
+    def describe(self, name):
+        cell = self.cells[name]
+        if cell.error:
+            return f"{name} = {cell.expr}  (error: {cell.error})"
+        value = render_number(self.values[name])
+        if value == cell.expr:
+            return f"{name} = {value}"
+        return f"{name} = {cell.expr} = {value}"
@@ -1,7 +1,35 @@
-print("Shakur's Calculator")
+import sys
+
+from calc_engine import Calculator, HistoryBuffer, batch_main, menu_choice, menu_line
+
+calc = Calculator()
+
+
+def show_result(choice, a, b, result, message):
+    # The menu's own output: results print alone and even/odd prints one
+    # line per number
+    if choice == '7':
+        print(f"{a} is Even" if a % 2 == 0 else f"{a} is odd")
+        print(f"{b} is Even" if b % 2 == 0 else f"{b} is Odd")
+    elif result is not None:
+        print("Result:", result)
+    elif choice == '6':
+        if message.endswith("= too large"):
+            print(f"Exponentiation: {a}**{b} = too large to display")
+        elif message.endswith("= overflow error"):
+            print(f"Result: {a}**{b} = result too large (overflow)")
+        else:
+            print(f"Exponentiation error: {message.partition('error: ')[2]}")
+    else:
+        print(message)
+
+
+def record_result(choice, a, b, result, message):
+    # History is the plain messages, without refused divisions and moduli
+    if result is not None or choice in ('6', '7'):
+        return message
+    return None
 
-history = []
-last_result = None
 
 def get_number_input(prompt):
     while True:
@@ -10,12 +38,12 @@ def get_number_input(prompt):
         if user_input.lower() == 'q':
             return 'back_to_menu'
         if user_input.lower() == 'ans':
-            if last_result is None:
+            if calc.last_result is None:
                 print("No previous result, please input a number.")
                 continue
             else:
-                print(f"Using last_result = {last_result}")
-                return last_result
+                print(f"Using last_result = {calc.last_result}")
+                return calc.last_result
         try:
             return float(user_input)
         except ValueError:
@@ -23,113 +51,65 @@ def get_number_input(prompt):
             continue
 
 
-while True:
-    print("\nChoose an operation:")
-    print("1. Addition")
-    print("2. Subtraction")
-    print("3. Multiplication")
-    print("4. Division")
-    print("5. Modulus")
-    print("6. Exponentiation")
-    print("7. Check Even/Odd")
-    print("8. Quit")
-    print("9. View History")
-    print("10. Clear history")
-
-    choice = input("Enter your choice (1-10): ")
-
-    if choice == '8':
-        print("Exiting Shakur's calculator. Goodbye and have a good day!")
-        break
-    if choice not in ['1','2','3','4','5','6','7','8','9','10']:
-        print("Invalid option! please select a valid option.")
-        continue
-    if choice == '9':
-        if len(history) == 0:
-            print("No calculations yet.")
-        else:
-            print("\n Calculation History:")
-            for i, record in enumerate(history, 1):
-                print(f"{i}. {record}")
-        continue
-
-    if choice == '10':
-        if len(history) == 0:
-            print("No Existing Calculations to be erased")
-        else:
-            confirm = input("Are you sure you want to clear all history? (y/n): ")
-            if confirm.lower() in ['y','yes']:
-                history = []
-                print("History Cleared!")
-            else:
-                print("Operation Cancelled")
-        continue
-
-    a_input = get_number_input("Enter first number (or 'q' to go back , 'ans'for last result): ")
-    if a_input == 'back_to_menu':
-        continue
-
-    b_input = get_number_input("Enter second number(or 'q' to go back,'ans'for last result): ")
-    if b_input == 'back_to_menu':
-        continue
-
-
-    try:
-        a = a_input
-        b = b_input
-
-        if choice == '1':
-            result = a + b
-            print("Result:", result)
-            history.append(f"{a} + {b} = {result}")
-            last_result = result
-        elif choice == '2':
-            result = a - b
-            print("Result:", result)
-            history.append(f"{a} - {b} = {result}")
-            last_result = result
-        elif choice == '3':
-            result = a * b
-            print("Result:", result)
-            history.append(f"{a} * {b} = {result}")
-            last_result = result
-        elif choice == '4':
-            if b != 0:
-                result = round(a / b, 2)
-                print("Result:", result)
-                history.append(f"{a} / {b} = {result}")
-                last_result = result
+def main():
+    print("Shakur's Calculator")
+    history = HistoryBuffer()
+
+    while True:
+        print("\nChoose an operation:")
+        print("1. Addition")
+        print("2. Subtraction")
+        print("3. Multiplication")
+        print("4. Division")
+        print("5. Modulus")
+        print("6. Exponentiation")
+        print("7. Check Even/Odd")
+        print("8. Quit")
+        print("9. View History")
+        print("10. Clear history")
+
+        choice = input("Enter your choice (1-10): ")
+
+        if choice == '8':
+            print("Exiting Shakur's calculator. Goodbye and have a good day!")
+            break
+        if choice not in ['1','2','3','4','5','6','7','8','9','10']:
+            print("Invalid option! please select a valid option.")
+            continue
+        if choice == '9':
+            if len(history) == 0:
+                print("No calculations yet.")
             else:
-                print("Cannot divide by zero. ")
-        elif choice == '5':
-            if b != 0:
-                result = a % b
-                print("Result:", result)
-                history.append(f"{a} % {b} = {result}")
-                last_result = result
+                print("\n Calculation History:")
+                for i, record in enumerate(history, 1):
+                    print(f"{i}. {record}")
+            continue
+
+        if choice == '10':
+            if len(history) == 0:
+                print("No Existing Calculations to be erased")
             else:
-                print("Cannot perform modulus with zero. ")
-        elif choice == '6':
-
-            try:
-                result = a ** b
-                if abs(result) > 10 ** 100:
-                    print(f"Exponentiation: {a}**{b} = too large to display")
-                    history.append(f"{a} ** {b} = too large")
+                confirm = input("Are you sure you want to clear all history? (y/n): ")
+                if confirm.lower() in ['y','yes']:
+                    history.clear()
+                    print("History Cleared!")
                 else:
-                    result = a ** b
-                    print("Result:", result)
-                    history.append(f"{a} ** {b} = {result}")
-                    last_result = result
-            except OverflowError:
-                print(f"Result: {a}**{b} = result too large (overflow)")
-                history.append(f"{a} ** {b} = overflow error")
-            except ValueError as e:
-                print(f"Exponentiation error: {e}")
-                history.append(f"{a} ** {b} = error: {e}")
-        elif choice == '7':
-            print(f"{a} is Even" if a % 2 == 0 else f"{a} is odd")
-            print(f"{b} is Even" if b % 2 == 0 else f"{b} is Odd")
-            history.append(f"Even/Odd: {a}(a_even_odd), {b}(b_even_odd)")
-    except ValueError:
-        print("Invalid input! please enter numbers only.")
+                    print("Operation Cancelled")
+            continue
+
+        a = get_number_input("Enter first number (or 'q' to go back , 'ans'for last result): ")
+        if a == 'back_to_menu':
+            continue
+
+        b = get_number_input("Enter second number(or 'q' to go back,'ans'for last result): ")
+        if b == 'back_to_menu':
+            continue
+
+        menu_choice(calc, choice, a, b, history, show_result, record_result)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        batch_main(sys.argv[2] if len(sys.argv) > 2 else '-', calc=calc, line_rule=menu_line)
+    else:
+        main()
@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+# Load generator for the Upgraded Calculator service:
+#   python3 "Upgraded Calculator.py" --serve
+#   python3 loadgen.py --clients 50 --requests 200
+
+REQUESTS = [
+    {"op": "eval", "expr": "(ans % 1000) * 1.07 - 3"},
+    {"op": "eval", "expr": "(1024 * 1024) * 3 + 7"},
+    {"op": "add", "args": [7098, 98]},
+    {"op": "divide", "args": [22, 7]},
+    {"op": "percentage_of", "args": [70, 100]},
+    {"op": "factorial", "args": [300]},
+]
+
+
+async def run_client(args, latencies, errors):
+    if args.unix:
+        reader, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    # every session starts with a plain number so 'ans' is defined
+    requests = [{"op": "eval", "expr": "1"}]
+    requests += [random.choice(REQUESTS) for _ in range(args.requests - 1)]
+    for request in requests:
+        start = time.perf_counter()
+        writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        line = await reader.readline()
+        latencies.append(time.perf_counter() - start)
+        if not line or not json.loads(line).get("ok"):
+            errors.append(line)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(args):
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(args, latencies, errors) for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"clients:   {args.clients}")
+    print(f"requests:  {len(latencies)} ({len(errors)} errors)")
+    print(f"req/sec:   {len(latencies) / elapsed:.0f}")
+    print(f"p50:       {p50 * 1000:.2f} ms")
+    print(f"p99:       {p99 * 1000:.2f} ms")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the calculator service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="connect to a Unix socket instead of TCP")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100, help="requests per client")
+    args = parser.parse_args()
+    errors = asyncio.run(run(args))
+    if errors:
+        print("first error:", errors[0])
+
+
+if __name__ == "__main__":
+    main()
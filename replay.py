@@ -0,0 +1,239 @@
+import argparse
+import importlib.util
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+from itertools import islice
+
+import calc_engine as uc
+
+# Replays a history file through the three front-ends' engines and checks
+# every result against what was recorded:
+#   python3 replay.py                                  (shakur_history.json)
+#   python3 replay.py big.json --engines calculator,safe_eval
+# and writes scaled-up corpora with the same mix of operations:
+#   python3 replay.py --synthesize 1000000 --out big.json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENGINES = ["shakur", "calculator", "safe_eval"]
+CHUNK = 50000  # records replayed per timing round, so memory stays flat
+
+# Record op -> expression that recomputes it, for safe_eval
+EXPRESSIONS = {
+    "add": "{a} + {b}",
+    "subtract": "{a} - {b}",
+    "multiply": "{a} * {b}",
+    "divide": "round({a} / {b}, 2)",
+    "modulus": "{a} % {b}",
+    "exponent": "{a} ** {b}",
+    "percentage_of": "{a} / 100.0 * {b}",
+    "factorial": "factorial({a})",
+}
+CALCULATOR_OPS = set(EXPRESSIONS) | {"check_even_odd", "base_convert"}
+EXACT_DIVIDE = "{a} / {b}"  # the exact modes don't round division
+
+
+def load_shakur():
+    spec = importlib.util.spec_from_file_location("shakur_machine", os.path.join(HERE, "shakur,s_machine.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def literal(x):
+    if not isinstance(x, (int, float)):
+        return f"({x})"  # Decimal / Fraction text, read back by the same mode
+    return f"({x!r})" if x < 0 else repr(x)
+
+
+def plain_numbers(values, kinds=(int, float)):
+    # huge ints are only kept as their rendering and can't be replayed
+    return all(isinstance(x, kinds) and not isinstance(x, bool) for x in values)
+
+
+def short_literal(x):
+    # Fractions too long to render in full can't be written as a literal
+    return "digits" not in uc.render_number(x)
+
+
+def decode_exact(values, calc):
+    # Decimal / Fraction values as the calculator's mode reads them back
+    return [calc.number(x["exact"]) if isinstance(x, dict) and "exact" in x else x for x in values]
+
+
+def engine_jobs(engine, records, calc, shakur):
+    # -> [(func, args, expected)]; expected is the message, or for
+    # safe_eval the numeric result
+    jobs = []
+    kinds = (int, float, calc.numbers.type)
+    if engine == "shakur":
+        choices = {name: choice for choice, name in shakur.OPERATIONS.items()}
+    for record in records:
+        op = record.get("op")
+        operands = record["operands"]
+        if calc.numbers.exact:
+            operands = decode_exact(operands, calc)
+            record = dict(record, result=decode_exact([record["result"]], calc)[0])
+        if op not in CALCULATOR_OPS or not plain_numbers(operands, kinds):
+            continue
+        if engine == "shakur":
+            if op in choices and len(operands) == 2:
+                jobs.append((shakur.perform_operation, (choices[op], *operands), uc.format_record(record)))
+        elif engine == "calculator":
+            jobs.append((getattr(calc, op), operands, uc.format_record(record)))
+        elif op in EXPRESSIONS and plain_numbers([record["result"]], kinds) and all(map(short_literal, operands)):
+            values = [literal(x) for x in operands] + [""]
+            template = EXACT_DIVIDE if op == "divide" and calc.numbers.exact else EXPRESSIONS[op]
+            expr = template.format(a=values[0], b=values[1])
+            jobs.append((uc.safe_eval, (expr, None, None, calc.numbers), record["result"]))
+    return jobs
+
+
+def run_jobs(engine, jobs, repeat):
+    # Times the calls alone, then checks the outputs; a call that raises
+    # counts as a mismatch instead of ending the replay
+    start = time.perf_counter()
+    for _ in range(repeat):
+        outputs = []
+        for func, args, _ in jobs:
+            try:
+                outputs.append(func(*args))
+            except Exception as e:
+                outputs.append(e)
+    elapsed = time.perf_counter() - start
+    mismatches = []
+    for (func, args, expected), output in zip(jobs, outputs):
+        if isinstance(output, Exception):
+            mismatches.append((args, expected, f"raised {type(output).__name__}: {output}"))
+            continue
+        try:
+            got = output if engine == "safe_eval" else output[1]
+        except TypeError:
+            got = output
+        if got != expected:
+            mismatches.append((args, expected, got))
+    return elapsed, mismatches
+
+
+def replay(args):
+    engines = args.engines.split(",")
+    for engine in engines:
+        if engine not in ENGINES:
+            sys.exit(f"unknown engine '{engine}' (choose from {', '.join(ENGINES)})")
+    calc = uc.Calculator(mode=args.mode, precision=args.precision)
+    shakur = load_shakur() if "shakur" in engines else None
+    if shakur is not None:
+        shakur.calc = calc
+    totals = {engine: [0, 0.0, []] for engine in engines}  # ops, seconds, mismatches
+    records = uc.HistoryReader(args.history).oldest()
+    if args.limit:
+        records = islice(records, args.limit)
+    seen = 0
+    while True:
+        chunk = list(islice(records, CHUNK))
+        if not chunk:
+            break
+        seen += len(chunk)
+        for engine in engines:
+            jobs = engine_jobs(engine, chunk, calc, shakur)
+            if not jobs:
+                continue
+            repeat = max(1, args.min_ops // len(jobs)) if seen == len(chunk) else 1
+            elapsed, mismatches = run_jobs(engine, jobs, repeat)
+            total = totals[engine]
+            total[0] += len(jobs) * repeat
+            total[1] += elapsed
+            total[2].extend(mismatches)
+
+    print(f"{seen} records in {args.history}")
+    print(f"{'engine':12s} {'ops':>10s} {'mismatches':>11s} {'ops/sec':>12s}")
+    failed = False
+    for engine, (ops, seconds, mismatches) in totals.items():
+        rate = f"{ops / seconds:12.0f}" if seconds else f"{'-':>12s}"
+        print(f"{engine:12s} {ops:10d} {len(mismatches):11d} {rate}")
+        for call_args, expected, got in mismatches[:3]:
+            print(f"    {call_args}: recorded {expected!r}, got {got!r}")
+        failed = failed or bool(mismatches)
+    if failed:
+        sys.exit(1)
+
+
+def similar(x, rng):
+    # A random number of about the same size and kind as x
+    if isinstance(x, int):
+        digits = len(str(abs(x)))
+        value = rng.randrange(10 ** (digits - 1) if digits > 1 else 0, 10 ** digits)
+        return -value if x < 0 else value
+    # 2 * abs(x) overflows to inf for templates near the float limit
+    high = min(2 * abs(x), sys.float_info.max)
+    return round(rng.uniform(0, high) * (-1 if x < 0 else 1), 2)
+
+
+def synthesize(args):
+    # Samples records from the template history and redraws their operands,
+    # recomputing each through the Calculator so the corpus stays valid
+    rng = random.Random(args.seed)
+    # inf and nan operands have nothing of a similar size to draw
+    templates = [r for r in uc.HistoryReader(args.history).oldest()
+                 if r.get("op") is not None and plain_numbers(r["operands"])
+                 and all(math.isfinite(x) for x in r["operands"] if isinstance(x, float))]
+    if not templates:
+        sys.exit(f"no usable records in {args.history} to base a corpus on")
+    calc = uc.Calculator(mode=args.mode, precision=args.precision)
+
+    def records():
+        ts = time.time()
+        session = uc.SESSION_ID
+        for i in range(args.synthesize):
+            if i % 1000 == 0:
+                session = f"{rng.getrandbits(32):08x}"
+            template = rng.choice(templates)
+            op = template["op"]
+            ts += rng.expovariate(1.0)
+            if op not in CALCULATOR_OPS:
+                yield dict(template, ts=ts, session=session)
+                continue
+            operands = [similar(x, rng) for x in template["operands"]]
+            if op == "base_convert":
+                operands[1] = template["operands"][1]
+            elif op == "factorial":
+                operands[0] = min(abs(operands[0]), calc.factorials.max_n)
+            result, message = getattr(calc, op)(*operands)
+            yield uc.make_record(op, operands, result, message, ts=ts, session=session)
+
+    start = time.perf_counter()
+    tmp = f"{args.out}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        count = uc.write_history(f, records())
+    os.replace(tmp, args.out)
+    elapsed = time.perf_counter() - start
+    mix = Counter(r["op"] for r in templates)
+    print(f"wrote {count} records to {args.out} in {elapsed:.1f}s ({count / elapsed:.0f} records/sec)")
+    print("mix: " + ", ".join(f"{op} {n / len(templates):.0%}" for op, n in mix.most_common()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay history through the calculator engines")
+    parser.add_argument("history", nargs="?", default=uc.HISTORY_FILE,
+                        help="history file to replay, or to base a synthesized corpus on")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="comma-separated: " + ", ".join(ENGINES))
+    parser.add_argument("--limit", type=int, help="replay only the first N records")
+    parser.add_argument("--min-ops", type=int, default=100000,
+                        help="repeat a small history until each engine has run this many operations")
+    parser.add_argument("--synthesize", type=int, metavar="N", help="write N records modelled on the history")
+    parser.add_argument("--out", default="synthetic_history.json", help="file for --synthesize")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mode", choices=uc.MODES, default="float", help="numeric mode to replay (or synthesize) in")
+    parser.add_argument("--precision", type=int, default=uc.DEFAULT_PRECISION, help="digits for --mode decimal")
+    args = parser.parse_args()
+    if args.synthesize:
+        synthesize(args)
+    else:
+        replay(args)
+
+
+if __name__ == "__main__":
+    main()
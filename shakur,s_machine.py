@@ -1,20 +1,15 @@
-import json
-import os
+import argparse
+import sys
 
-HISTORY_FILE = "shakur_history.json"
-last_result = None
+from calc_engine import (
+    DEFAULT_PRECISION, HISTORY_FILE, MENU_OPERATIONS, MODES, Calculator, HistoryBuffer,
+    JournalHistoryManager, batch_main, format_record, menu_choice, menu_line,
+)
 
-
-def load_history():
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r") as f:
-            return json.load(f)
-    return []
-
-
-def save_history(history):
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=4)
+# Menu choices -> engine Calculator methods; history goes through the same
+# journal and lock as the Upgraded Calculator, so both can share the file.
+OPERATIONS = MENU_OPERATIONS
+calc = Calculator()
 
 
 def get_number_input(prompt, last_result):
@@ -31,7 +26,7 @@ def get_number_input(prompt, last_result):
                 print(f"Using last_result = {last_result}")
                 return last_result
         try:
-            return float(user_input)
+            return calc.number(user_input)
         except ValueError:
             print("Invalid input, please enter a number, 'ans', or 'q' to go back.")
             continue
@@ -39,39 +34,7 @@ def get_number_input(prompt, last_result):
 
 
 def perform_operation(choice, a, b):
-    if choice == "1":
-        return a + b, f"{a} + {b} = {a + b}"
-    elif choice == "2":
-        return a - b, f"{a} - {b} = {a - b}"
-    elif choice == "3":
-        return a * b, f"{a} * {b} = {a * b}"
-    elif choice == "4":
-        if b != 0:
-            result = round(a / b, 2)
-            return result, f"{a} / {b} = {result}"
-        else:
-            return None, "Cannot divide by zero."
-    elif choice == "5":
-        if b != 0:
-            return a % b, f"{a} % {b} = {a % b}"
-        else:
-            return None, "Cannot perform modulus with zero."
-    elif choice == "6":
-        try:
-            result = a ** b
-            if abs(result) > 10**100:
-                return None, f"{a} ** {b} = too large"
-            else:
-                return result, f"{a} ** {b} = {result}"
-        except OverflowError:
-            return None, f"{a} ** {b} = overflow error"
-        except ValueError as e:
-            return None, f"{a} ** {b} = error: {e}"
-    elif choice == "7":
-        even_odd_a = "Even" if a % 2 == 0 else "Odd"
-        even_odd_b = "Even" if b % 2 == 0 else "Odd"
-        return None, f"{a} is {even_odd_a}, {b} is {even_odd_b}"
-
+    return getattr(calc, OPERATIONS[choice])(a, b)
 
 
 def show_menu():
@@ -89,8 +52,8 @@ def show_menu():
 
 
 def main():
-    global last_result
-    history = load_history()
+    manager = JournalHistoryManager(HISTORY_FILE)
+    history = HistoryBuffer(manager.load_history())
     print("Welcome to Shakur's Calculator (Modular Edition)")
 
     while True:
@@ -98,7 +61,7 @@ def main():
         choice = input("Enter your choice (1–10): ")
 
         if choice == "8":
-            save_history(history)
+            manager.save_history(history)
             print("History saved. Goodbye and have a good day!")
             break
 
@@ -108,7 +71,7 @@ def main():
             else:
                 print("\nCalculation History:")
                 for i, record in enumerate(history, 1):
-                    print(f"{i}. {record}")
+                    print(f"{i}. {format_record(record)}")
             continue
 
         if choice == "10":
@@ -117,7 +80,7 @@ def main():
             else:
                 confirm = input("Are you sure you want to clear all history? (y/n): ")
                 if confirm.lower() in ["y", "yes"]:
-                    history = []
+                    history.clear()
                     print("History cleared!")
                 else:
                     print("Operation cancelled.")
@@ -127,19 +90,27 @@ def main():
             print("Invalid option! Please select a valid option.")
             continue
 
-        a = get_number_input("Enter first number (or 'q'/'ans'): ", last_result)
+        a = get_number_input("Enter first number (or 'q'/'ans'): ", calc.last_result)
         if a == "back_to_menu":
             continue
-        b = get_number_input("Enter second number (or 'q'/'ans'): ", last_result)
+        b = get_number_input("Enter second number (or 'q'/'ans'): ", calc.last_result)
         if b == "back_to_menu":
             continue
 
-        result, message = perform_operation(choice, a, b)
-        print("Result:", message)
-        history.append(message)
-        if result is not None:
-            last_result = result
+        menu_choice(calc, choice, a, b, history)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Shakur's Calculator")
+    parser.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                        help="run 'op a b' lines from FILE ('-' or nothing for stdin)")
+    parser.add_argument("--mode", choices=MODES, default="float",
+                        help="numbers as floats (default), exact decimals or exact fractions")
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION, metavar="DIGITS",
+                        help=f"significant digits in decimal mode (default {DEFAULT_PRECISION})")
+    args = parser.parse_args()
+    calc = Calculator(mode=args.mode, precision=args.precision)
+    if args.batch is not None:
+        batch_main(args.batch, calc=calc, line_rule=menu_line)
+    else:
+        main()
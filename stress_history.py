@@ -0,0 +1,98 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import calc_engine as uc
+
+# Several processes writing one history file at once; checks that no record
+# is lost or duplicated and reports throughput as the process count doubles.
+#   python3 stress_history.py --processes 8 --records 2000
+
+def writer(path, worker, records, batch, compact_every, fsync):
+    # journal appends, with a compaction every `compact_every` records
+    manager = uc.JournalHistoryManager(path, flush_every=batch, fsync=fsync)
+    for i in range(records):
+        manager.append(uc.make_record("add", [worker, i], worker + i, f"{worker} + {i} = {worker + i}"))
+        if compact_every and (i + 1) % compact_every == 0:
+            manager.compact()
+    manager.close()
+
+
+def saver(path, worker, records, rounds):
+    # load / add / save_history: the merge-on-write path
+    manager = uc.JournalHistoryManager(path)
+    per_round = max(1, records // rounds)
+    i = 0
+    while i < records:
+        history = manager.load_history()
+        for _ in range(min(per_round, records - i)):
+            history.append(uc.make_record("multiply", [worker, i], worker * i, f"{worker} * {i} = {worker * i}"))
+            i += 1
+        manager.save_history(history)
+
+
+def run(processes, args):
+    directory = tempfile.mkdtemp(prefix="history-stress-", dir=args.dir)
+    path = os.path.join(directory, "history.json")
+    jobs = []
+    for worker in range(processes):
+        if worker < args.savers:
+            target, extra = saver, (args.records, args.rounds)
+        else:
+            target, extra = writer, (args.records, args.batch, args.compact_every, not args.no_fsync)
+        jobs.append(multiprocessing.Process(target=target, args=(path, worker) + extra))
+    start = time.perf_counter()
+    for job in jobs:
+        job.start()
+    for job in jobs:
+        job.join()
+    elapsed = time.perf_counter() - start
+
+    seen = {}
+    for record in uc.JournalHistoryManager(path).load_history():
+        key = (record["op"], tuple(record["operands"]))
+        seen[key] = seen.get(key, 0) + 1
+    expected = {("multiply" if worker < args.savers else "add", (worker, i))
+                for worker in range(processes) for i in range(args.records)}
+    lost = len(expected - seen.keys())
+    duplicated = sum(count - 1 for count in seen.values())
+    failed = sum(job.exitcode != 0 for job in jobs)
+    shutil.rmtree(directory)
+    return len(expected), elapsed, lost, duplicated, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress the shared history file with concurrent writers")
+    parser.add_argument("--processes", type=int, default=8, help="largest number of writer processes")
+    parser.add_argument("--records", type=int, default=2000, help="records per process")
+    parser.add_argument("--batch", type=int, default=10, help="records per group commit")
+    parser.add_argument("--compact-every", type=int, default=500, help="records between compactions (0 = never)")
+    parser.add_argument("--savers", type=int, default=1, help="processes using load/save_history instead")
+    parser.add_argument("--rounds", type=int, default=20, help="save_history calls per saver")
+    parser.add_argument("--no-fsync", action="store_true")
+    parser.add_argument("--dir", help="directory for the test files (default: system temp)")
+    args = parser.parse_args()
+
+    print(f"{'processes':>9s} {'records':>9s} {'seconds':>8s} {'rec/sec':>9s} {'lost':>5s} {'dup':>5s}")
+    errors = 0
+    processes = 1
+    while True:
+        count = min(processes, args.processes)
+        total, elapsed, lost, duplicated, failed = run(count, args)
+        print(f"{count:9d} {total:9d} {elapsed:8.2f} {total / elapsed:9.0f} {lost:5d} {duplicated:5d}")
+        errors += lost + duplicated + failed
+        if count >= args.processes:
+            break
+        processes *= 2
+    if errors:
+        print("FAILED: records were lost or duplicated")
+        sys.exit(1)
+    print("ok: no records lost")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import io
+
+from calc_engine.batch import menu_line, run_batch
+from calc_engine.calculator import Calculator
+
+
+def test_menu_batch_lines():
+    lines = ["# comment", "+ 2 3", "* ans 4", "", "6 2 10", "/ 1 0", "x 1 2", "+ 1", "+ a 2"]
+    out = io.StringIO()
+    run_batch(lines, out, Calculator(), line_rule=menu_line)
+    assert out.getvalue().splitlines() == [
+        "2.0 + 3.0 = 5.0",
+        "5.0 * 4.0 = 20.0",
+        "2.0 ** 10.0 = 1024.0",
+        "Cannot divide by zero.",
+        "line 7: error: unknown operation 'x'",
+        "line 8: error: expected 'op a b'",
+        "line 9: error: could not convert string to float: 'a'",
+    ]
+
+
+def test_menu_batch_ans_needs_a_result():
+    out = io.StringIO()
+    run_batch(["+ ans 1"], out, Calculator(), line_rule=menu_line)
+    assert out.getvalue() == "line 1: error: no previous result for 'ans'\n"
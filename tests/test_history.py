@@ -0,0 +1,34 @@
+import json
+
+from calc_engine.history import HistoryReader, write_history
+
+RECORDS = [
+    {"op": "add", "operands": [1, 2], "result": 3, "ts": 1.0, "session": "a", "text": "1 + 2 = 3"},
+    {"op": "factorial", "operands": [5], "result": 120, "ts": 2.0, "session": "a", "text": "5! = 120"},
+    "Legacy line",
+]
+
+
+def test_count_one_record_per_line(tmp_path):
+    path = tmp_path / "h.json"
+    with open(path, "w") as f:
+        write_history(f, RECORDS)
+    with open(str(path) + ".log", "w") as f:
+        f.write(json.dumps(RECORDS[0]) + "\n")
+    assert HistoryReader(str(path)).count() == 4
+
+
+def test_count_indented_snapshot(tmp_path):
+    path = tmp_path / "h.json"
+    with open(path, "w") as f:
+        json.dump(RECORDS, f, indent=4)
+    reader = HistoryReader(str(path))
+    assert reader.count() == 3
+    assert reader.count() == len(reader.tail(10)) == len(list(reader.oldest()))
+
+
+def test_count_indented_plain_records(tmp_path):
+    path = tmp_path / "h.json"
+    with open(path, "w") as f:
+        json.dump(["one", "two", "three"], f, indent=4)
+    assert HistoryReader(str(path)).count() == 3
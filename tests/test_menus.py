@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_menu(script, keys, cwd):
+    # The scripts keep their history in the working directory
+    env = dict(os.environ, PYTHONPATH=HERE)
+    return subprocess.run([sys.executable, os.path.join(HERE, script)], input=keys, cwd=cwd,
+                          env=env, capture_output=True, text=True, timeout=30)
+
+
+@pytest.mark.parametrize("script, shown", [
+    ("calculator.py", "Exponentiation error: division by zero"),
+    ("shakur,s_machine.py", "Result: 0.0 ** -1.0 = error: division by zero"),
+    ("Upgraded Calculator.py", "Result: 0 ** -1 = error: division by zero"),
+])
+def test_zero_to_a_negative_power(script, shown, tmp_path):
+    done = run_menu(script, "6\n0\n-1\n8\n", tmp_path)
+    assert done.returncode == 0, done.stderr
+    assert "Traceback" not in done.stderr
+    assert shown in done.stdout
@@ -0,0 +1,36 @@
+import io
+
+import pytest
+
+from calc_engine.batch import run_batch
+from calc_engine.calculator import Calculator
+from calc_engine.expression import safe_eval
+from calc_engine.numeric import numeric_mode
+
+ZERO_DIVISIONS = ["1 / 0", "1 // 0", "1 % 0", "0 ** -1", "1 / (2 - 2)", "ans / 0"]
+
+
+@pytest.mark.parametrize("mode", ["float", "decimal", "fraction"])
+@pytest.mark.parametrize("expr", ZERO_DIVISIONS)
+def test_zero_division_message(mode, expr):
+    with pytest.raises(ZeroDivisionError, match="^division by zero$"):
+        safe_eval(expr, 3, mode=numeric_mode(mode))
+
+
+def test_fraction_batch_zero_division():
+    out = io.StringIO()
+    run_batch(["1 / 0", "1/3 + 1/6", "ans / (ans - 1/2)", "0 ** -2"], out, Calculator(mode="fraction"))
+    assert out.getvalue().splitlines() == [
+        "line 1: error: division by zero",
+        "Expression = 1/2",
+        "line 3: error: division by zero",
+        "line 4: error: division by zero",
+    ]
+
+
+def test_fraction_mode_error():
+    mode = numeric_mode("fraction")
+    error = mode.error(ZeroDivisionError("Fraction(1, 0)"))
+    assert isinstance(error, ZeroDivisionError) and str(error) == "division by zero"
+    overflow = OverflowError("too big")
+    assert mode.error(overflow) is overflow
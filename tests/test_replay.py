@@ -0,0 +1,36 @@
+import json
+import math
+import random
+from argparse import Namespace
+
+import replay
+from calc_engine.history import HistoryReader, make_record
+
+
+def test_similar_stays_finite_near_the_float_limit():
+    rng = random.Random(1)
+    for x in (1e308, -1.7e308, 5e-324):
+        assert all(math.isfinite(replay.similar(x, rng)) for _ in range(1000))
+
+
+def test_synthesize_from_huge_and_infinite_operands(tmp_path):
+    history = tmp_path / "h.json"
+    records = [make_record("add", [1e308, 1.5e308], float("inf"), "1e308 + 1.5e308 = inf"),
+               make_record("multiply", [float("inf"), 2.0], float("inf"), "inf * 2.0 = inf"),
+               make_record("subtract", [10 ** 400, 2], 10 ** 400 - 2, "huge")]
+    history.write_text(json.dumps(records))
+    out = tmp_path / "syn.json"
+    replay.synthesize(Namespace(history=str(history), out=str(out), synthesize=200, seed=3,
+                                mode="float", precision=28))
+    corpus = list(HistoryReader(str(out)).oldest())
+    assert len(corpus) == 200
+    assert all(math.isfinite(x) for r in corpus for x in r["operands"] if isinstance(x, float))
+
+
+def test_run_jobs_counts_a_raising_call_as_a_mismatch():
+    def boom(a, b):
+        raise OverflowError("too big")
+
+    jobs = [(boom, (1, 2), "x"), (lambda a, b: (a + b, f"{a} + {b}"), (1, 2), "1 + 2")]
+    elapsed, mismatches = replay.run_jobs("calculator", jobs, 2)
+    assert mismatches == [((1, 2), "x", "raised OverflowError: too big")]
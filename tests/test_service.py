@@ -0,0 +1,70 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from calc_engine.calculator import Calculator
+from calc_engine.pool import JobPool
+from calc_engine.service import _service_job, serve
+
+HEAVY = "factorial(40000) % 7 + comb(200000, 100000) % 3"
+
+
+def test_heavy_is_decided_from_the_program():
+    calc = Calculator()
+    assert _service_job(calc, json.dumps({"expr": HEAVY}))[1]
+    assert _service_job(calc, json.dumps({"expr": "2 ** 10"}))[1]
+    assert _service_job(calc, json.dumps({"expr": "+".join(["1"] * 40)}))[1]
+    assert not _service_job(calc, json.dumps({"expr": "1 + 1"}))[1]
+    assert _service_job(calc, "! 50")[1]
+    assert _service_job(calc, "sqrt(factorial(300))")[1]
+    assert not _service_job(calc, "+ 1 2")[1]
+    assert not _service_job(calc, "x = 3")[1]
+    # The workers don't have this session's variables
+    assert not _service_job(calc, "x ** 2")[1]
+
+
+def _ask(path, line):
+    with socket.socket(socket.AF_UNIX) as conn:
+        conn.connect(path)
+        conn.sendall((line + "\n").encode())
+        reply = conn.makefile().readline()
+    return json.loads(reply)
+
+
+def _run_server(path, history_file):
+    pool = JobPool(workers=1)
+    try:
+        asyncio.run(serve(unix_path=path, pool=pool, history_file=history_file))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
+
+
+def test_small_request_is_not_held_up_by_a_heavy_one(tmp_path):
+    # The server gets its own process: a blocked loop there also holds its GIL
+    path = str(tmp_path / "calc.sock")
+    server = multiprocessing.Process(target=_run_server, args=(path, str(tmp_path / "h.json")))
+    server.start()
+    try:
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        replies = {}
+        heavy = threading.Thread(target=lambda: replies.update(big=_ask(path, json.dumps({"expr": HEAVY}))))
+        heavy.start()
+        time.sleep(0.1)
+        start = time.perf_counter()
+        small = _ask(path, "1 + 1")
+        waited = time.perf_counter() - start
+        heavy.join()
+    finally:
+        os.kill(server.pid, signal.SIGINT)
+        server.join()
+    assert small == {"ok": True, "result": 2, "message": "Expression = 2"}
+    assert replies["big"]["ok"] and replies["big"]["result"] == 0
+    assert waited < 0.3